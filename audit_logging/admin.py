@@ -18,8 +18,121 @@
 #
 #########################################################################
 
+import functools
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
 from . import models
+from .audit_settings import AUDIT_ADMIN_COUNT_LIMIT, AUDIT_ADMIN_LARGE_TABLE
+from .compact import event_lookup
+from .utils import configure_audit_models
+
+
+# Query string parameter holding the '<datetime>,<id>' of the last event on the previous page.
+CURSOR_VAR = 'older_than'
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Paginator that doesn't COUNT(*) the whole table: an unfiltered queryset's count comes from the database's
+        table statistics (PostgreSQL/MySQL), anything else is counted up to AUDIT_ADMIN_COUNT_LIMIT rows.
+    """
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = self.estimated_table_rows()
+            if estimate is not None:
+                return estimate
+        return self.object_list.order_by()[:AUDIT_ADMIN_COUNT_LIMIT].count()
+
+    def estimated_table_rows(self):
+        connection = connections[self.object_list.db]
+        table = self.object_list.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            # Includes partitions when the table is partitioned (see partitioning.py).
+            sql = (
+                'SELECT SUM(GREATEST(reltuples, 0)) FROM pg_class WHERE oid = to_regclass(%s) '
+                'OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))'
+            )
+            params = [table, table]
+        elif connection.vendor == 'mysql':
+            sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+            params = [table]
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return int(row[0])
+
+
+class KeysetChangeList(ChangeList):
+    """ ChangeList that pages through events newest first by (datetime, id) so later pages don't need an OFFSET over
+        every newer row.  With a column sort selected it falls back to normal pagination.
+    """
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = None
+        if ORDER_VAR not in request.GET:
+            self.cursor = self.parse_cursor(request.GET.get(CURSOR_VAR, ''))
+        super(KeysetChangeList, self).__init__(request, *args, **kwargs)
+
+    @staticmethod
+    def parse_cursor(value):
+        datetime_value, _, pk = value.rpartition(',')
+        dt = parse_datetime(datetime_value)
+        if dt is None or not pk.isdigit():
+            return None
+        return dt, int(pk)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super(KeysetChangeList, self).get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request):
+        queryset = super(KeysetChangeList, self).get_queryset(request)
+        if self.cursor is not None:
+            dt, pk = self.cursor
+            queryset = queryset.filter(Q(datetime__lt=dt) | Q(datetime=dt, pk__lt=pk))
+        return queryset
+
+    def get_results(self, request):
+        if self.cursor is not None:
+            # Pages are counted from the cursor.
+            self.page_num = 0
+        super(KeysetChangeList, self).get_results(request)
+        self.older_url = None
+        if ORDER_VAR not in self.params and self.multi_page:
+            result_list = list(self.result_list)
+            self.result_list = result_list
+            if result_list:
+                last = result_list[-1]
+                self.older_url = self.get_query_string(
+                    {CURSOR_VAR: '{},{}'.format(last.datetime.isoformat(), last.pk)}, [PAGE_VAR]
+                )
+
+
+class ResourceTypeFilter(admin.SimpleListFilter):
+    """ Resource type choices from AUDIT_MODELS rather than a SELECT DISTINCT over the table.
+    """
+    title = 'resource type'
+    parameter_name = 'resource_type'
+
+    def lookups(self, request, model_admin):
+        resource_types = sorted(set(configure_audit_models().keys()) | {'file'})
+        return [(resource_type, resource_type) for resource_type in resource_types]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{event_lookup(queryset.model, 'resource_type'): self.value()})
+        return queryset
 
 
 class AuditEventAdmin(admin.ModelAdmin):
@@ -63,5 +176,62 @@ class AuditEventAdmin(admin.ModelAdmin):
     def __init__(self, *args, **kwargs):
         super(AuditEventAdmin, self).__init__(*args, **kwargs)
         self.list_display_links = None
+        if AUDIT_ADMIN_LARGE_TABLE:
+            self.list_filter = [ResourceTypeFilter]
+            self.date_hierarchy = 'datetime'
+            self.ordering = ['-datetime', '-id']
+            self.paginator = EstimatedCountPaginator
+            self.show_full_result_count = False
+            self.change_list_template = 'admin/audit_logging/auditevent/large_table_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        if AUDIT_ADMIN_LARGE_TABLE:
+            return KeysetChangeList
+        return super(AuditEventAdmin, self).get_changelist(request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not AUDIT_ADMIN_LARGE_TABLE:
+            return super(AuditEventAdmin, self).get_search_results(request, queryset, search_term)
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        lookup = functools.partial(event_lookup, queryset.model)
+        # The range lets the (username, datetime) index find the prefix under any collation.
+        condition = Q(**{
+            lookup('username__gte'): search_term, lookup('username__lt'): search_term + u'\U0010ffff',
+            lookup('username__startswith'): search_term
+        })
+        condition |= Q(**{lookup('resource_type'): search_term})
+        if request.GET.get(ResourceTypeFilter.parameter_name):
+            # Uses the (resource_type, resource_uuid, datetime) index along with the resource type filter.
+            condition |= Q(resource_uuid=search_term)
+        return queryset.filter(condition), False
+
+
+def actor_column(name, boolean=False):
+    """ @return: A CompactAuditEventAdmin method showing field name of an event's actor, as the AuditEvent field of the
+            same name is shown by AuditEventAdmin.
+    """
+    def column(model_admin, obj):
+        return obj.actor and getattr(obj.actor, name)
+    column.short_description = name
+    column.admin_order_field = 'actor__' + name
+    column.boolean = boolean
+    return column
+
+
+class CompactAuditEventAdmin(AuditEventAdmin):
+    """ AuditEventAdmin for the CompactAuditEvent rows written with AUDIT_STORAGE = 'compact', showing the event,
+        resource type & user details from the lookup tables.
+    """
+    list_select_related = ['event', 'actor', 'resource_type']
+    search_fields = [event_lookup(models.CompactAuditEvent, field) for field in AuditEventAdmin.search_fields]
+
+    username = actor_column('username')
+    email = actor_column('email')
+    fullname = actor_column('fullname')
+    superuser = actor_column('superuser', boolean=True)
+    staff = actor_column('staff', boolean=True)
 
 admin.site.register(models.AuditEvent, AuditEventAdmin)
+admin.site.register(models.CompactAuditEvent, CompactAuditEventAdmin)
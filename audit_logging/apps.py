@@ -25,4 +25,10 @@ class AuditConfig(AppConfig):
     verbose_name = 'Logging to provide file/django model CRUD audit trail'
 
     def ready(self):
-        import audit_logging.signals  # noqa
+        from audit_logging.audit_settings import AUDIT_TO_FILE, AUDIT_LOGFILE_REOPEN_ON_SIGHUP
+        from audit_logging.signals import connect_model_signals
+        connect_model_signals()
+
+        if AUDIT_TO_FILE and AUDIT_LOGFILE_REOPEN_ON_SIGHUP:
+            from audit_logging.log_file import install_sighup_handler
+            install_sighup_handler()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Writes event records to the database from a background thread so request threads only pay for a queue put.
+"""
+import atexit
+import json
+from logging import getLogger
+import os
+import queue
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+
+from audit_logging.audit_settings import (
+    AUDIT_ASYNC_QUEUE_SIZE, AUDIT_ASYNC_OVERFLOW, AUDIT_ASYNC_SPILL_LOCATION, AUDIT_BUFFER_SIZE
+)
+from audit_logging.metrics import metrics
+from audit_logging.writers import write_events
+
+
+logger = getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+
+# Queued to tell the writer thread to exit.
+_STOP = object()
+
+
+class AsyncEventWriter(object):
+    """ Bounded queue of event records drained by a dedicated writer thread, which writes up to batch_size
+        records per INSERT.
+        counters holds running totals of records 'queued', 'written', 'dropped', 'spilled' and 'failed'.
+    """
+    def __init__(self, max_size=AUDIT_ASYNC_QUEUE_SIZE, overflow=AUDIT_ASYNC_OVERFLOW,
+                 spill_location=AUDIT_ASYNC_SPILL_LOCATION, batch_size=AUDIT_BUFFER_SIZE):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown audit overflow policy {}, expected one of {}'.format(overflow, OVERFLOW_POLICIES))
+        self.max_size = max_size
+        self.overflow = overflow
+        self.spill_location = spill_location
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.counters = {'queued': 0, 'written': 0, 'dropped': 0, 'spilled': 0, 'failed': 0}
+        self.queue = queue.Queue(max_size)
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        """ Starts the writer thread if it isn't running in this process (it doesn't survive a fork).
+        """
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # Forked child: the parent's queued records are the parent's to write.
+                self.queue = queue.Queue(self.max_size)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name='audit-logging-writer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def put(self, record):
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'spill':
+                self.spill(record)
+                return
+            elif self.overflow == 'drop_oldest':
+                self.put_dropping_oldest(record)
+            else:
+                self.queue.put(record)
+        self.increment('queued')
+
+    def put_dropping_oldest(self, record):
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.increment('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                continue
+
+    def spill(self, record):
+        with self.lock:
+            with open(self.spill_location, 'a') as f:
+                f.write(json.dumps(record, cls=DjangoJSONEncoder, sort_keys=True))
+                f.write('\n')
+            self.counters['spilled'] += 1
+
+    def increment(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def metric_samples(self):
+        """ Collector for metrics.metrics (see metrics.Metrics).
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        samples = [
+            ('audit_async_events_total', 'counter', {'outcome': outcome}, count) for outcome, count in counters.items()
+        ]
+        samples.append(('audit_async_queue_depth', 'gauge', {}, self.depth()))
+        return samples
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            record = self.queue.get()
+            while True:
+                if record is _STOP:
+                    stopping = True
+                else:
+                    batch.append(record)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                write_events(batch)
+                self.increment('written', len(batch))
+            except Exception as ex:
+                self.increment('failed', len(batch))
+                logger.exception('Exception writing {} queued audit events.'.format(len(batch)))
+                metrics.count_error('async_write', ex)
+            finally:
+                close_old_connections()
+                for i in range(len(batch) + (1 if stopping else 0)):
+                    self.queue.task_done()
+
+    def flush(self):
+        """ Blocks until every record queued so far has been written (or has failed to be written).
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            self.queue.join()
+
+    def stop(self, timeout=None):
+        """ Writes the remaining queued records and stops the writer thread.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and self.pid == os.getpid():
+            self.queue.put(_STOP)
+            thread.join(timeout)
+
+
+async_writer = AsyncEventWriter()
+atexit.register(async_writer.stop, 10)
+metrics.add_collector(async_writer.metric_samples)
+
+
+def replay_spilled_events(spill_location=AUDIT_ASYNC_SPILL_LOCATION, batch_size=AUDIT_BUFFER_SIZE):
+    """ Writes records spilled to spill_location by the 'spill' overflow policy to the database and removes the file.
+        @return: Number of records written.
+    """
+    if not os.path.exists(spill_location):
+        return 0
+
+    # Move the file aside first so records spilled while replaying aren't lost.
+    replaying_location = '{}.replaying'.format(spill_location)
+    os.rename(spill_location, replaying_location)
+    count = 0
+    batch = []
+    with open(replaying_location) as f:
+        for line in f:
+            record = json.loads(line)
+            record['datetime'] = parse_datetime(record['datetime'])
+            if record.get('last_datetime'):
+                record['last_datetime'] = parse_datetime(record['last_datetime'])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                write_events(batch)
+                count += len(batch)
+                batch = []
+    write_events(batch)
+    count += len(batch)
+    os.remove(replaying_location)
+    return count
@@ -31,3 +31,181 @@ AUDIT_LOGFILE_LOCATION = getattr(
     'AUDIT_LOGFILE_LOCATION',
     'audit_log.json'
 )
+# When True, AuditEvent rows are collected in memory and written with bulk_create()
+#   once AUDIT_BUFFER_SIZE events are pending, AUDIT_BUFFER_INTERVAL seconds have passed since the last flush,
+#   at the end of each request (UserDetailsMiddleware) and at process exit.
+AUDIT_BUFFER_EVENTS = getattr(
+    settings,
+    'AUDIT_BUFFER_EVENTS',
+    False
+)
+AUDIT_BUFFER_SIZE = getattr(
+    settings,
+    'AUDIT_BUFFER_SIZE',
+    100
+)
+AUDIT_BUFFER_INTERVAL = getattr(
+    settings,
+    'AUDIT_BUFFER_INTERVAL',
+    5
+)
+# When True, log_event() only queues the event record; a background thread writes queued records to the database.
+#   AUDIT_ASYNC_OVERFLOW decides what happens when AUDIT_ASYNC_QUEUE_SIZE records are already queued:
+#   'block' waits for room, 'drop_oldest' discards the oldest queued record and 'spill' appends the record to
+#   AUDIT_ASYNC_SPILL_LOCATION (JSON lines, see async_writer.replay_spilled_events()).
+AUDIT_ASYNC = getattr(
+    settings,
+    'AUDIT_ASYNC',
+    False
+)
+AUDIT_ASYNC_QUEUE_SIZE = getattr(
+    settings,
+    'AUDIT_ASYNC_QUEUE_SIZE',
+    10000
+)
+AUDIT_ASYNC_OVERFLOW = getattr(
+    settings,
+    'AUDIT_ASYNC_OVERFLOW',
+    'block'
+)
+AUDIT_ASYNC_SPILL_LOCATION = getattr(
+    settings,
+    'AUDIT_ASYNC_SPILL_LOCATION',
+    'audit_spill.json'
+)
+# The AUDIT_TO_FILE log is kept open between entries.  Entries are written once AUDIT_LOGFILE_BUFFER_SIZE bytes
+#   are pending (0 writes every entry immediately), at most AUDIT_LOGFILE_FLUSH_INTERVAL seconds after they're
+#   logged (by a timer thread if no other entry comes along) and at process exit.  AUDIT_LOGFILE_FSYNC forces written entries to disk.
+#   With AUDIT_LOGFILE_REOPEN_ON_SIGHUP the file is reopened after SIGHUP, e.g. from logrotate's postrotate.
+AUDIT_LOGFILE_BUFFER_SIZE = getattr(
+    settings,
+    'AUDIT_LOGFILE_BUFFER_SIZE',
+    0
+)
+AUDIT_LOGFILE_FLUSH_INTERVAL = getattr(
+    settings,
+    'AUDIT_LOGFILE_FLUSH_INTERVAL',
+    1
+)
+AUDIT_LOGFILE_FSYNC = getattr(
+    settings,
+    'AUDIT_LOGFILE_FSYNC',
+    False
+)
+AUDIT_LOGFILE_REOPEN_ON_SIGHUP = getattr(
+    settings,
+    'AUDIT_LOGFILE_REOPEN_ON_SIGHUP',
+    False
+)
+# The AUDIT_TO_FILE log is moved aside to a timestamped segment once it would grow past AUDIT_LOGFILE_MAX_BYTES
+#   (0 disables) and/or, with AUDIT_LOGFILE_ROTATE_DAILY, on the first write of each UTC day.  Closed segments are
+#   compressed with AUDIT_LOGFILE_COMPRESSION (None, 'gzip' or 'zstd', which needs the zstandard package) and listed
+#   with the times of their first & last entries in '<AUDIT_LOGFILE_LOCATION>.manifest.json'.
+AUDIT_LOGFILE_MAX_BYTES = getattr(
+    settings,
+    'AUDIT_LOGFILE_MAX_BYTES',
+    0
+)
+AUDIT_LOGFILE_ROTATE_DAILY = getattr(
+    settings,
+    'AUDIT_LOGFILE_ROTATE_DAILY',
+    False
+)
+AUDIT_LOGFILE_COMPRESSION = getattr(
+    settings,
+    'AUDIT_LOGFILE_COMPRESSION',
+    None
+)
+# When True, a LoggingFile records at most one FileRead and one FileWrite event (with the number of calls & their
+#   total size) when it's closed, or every AUDIT_FILE_EVENTS_AGGREGATE_INTERVAL seconds if that is set,
+#   instead of an event for every read/write call.
+AUDIT_FILE_EVENTS_AGGREGATE = getattr(
+    settings,
+    'AUDIT_FILE_EVENTS_AGGREGATE',
+    False
+)
+AUDIT_FILE_EVENTS_AGGREGATE_INTERVAL = getattr(
+    settings,
+    'AUDIT_FILE_EVENTS_AGGREGATE_INTERVAL',
+    None
+)
+# Used by the audit_partitions management command: AuditEvent storage is split into AUDIT_PARTITION_PERIOD
+#   ('monthly' or 'daily') partitions (PostgreSQL) or rolling tables (other databases), and those holding only
+#   events from before the last AUDIT_RETENTION_PERIODS periods are dropped (None keeps everything).
+#   AUDIT_PARTITIONS_AHEAD future PostgreSQL partitions are created in advance.
+AUDIT_PARTITION_PERIOD = getattr(
+    settings,
+    'AUDIT_PARTITION_PERIOD',
+    'monthly'
+)
+AUDIT_RETENTION_PERIODS = getattr(
+    settings,
+    'AUDIT_RETENTION_PERIODS',
+    None
+)
+AUDIT_PARTITIONS_AHEAD = getattr(
+    settings,
+    'AUDIT_PARTITIONS_AHEAD',
+    3
+)
+# When True, AuditEventAdmin avoids whole-table queries so it stays usable on very large tables: page counts are
+#   estimated (PostgreSQL/MySQL table statistics, otherwise counting stops at AUDIT_ADMIN_COUNT_LIMIT rows),
+#   'Older events' links page by (datetime, id) instead of OFFSET, filters & the date hierarchy only use indexed
+#   columns and search matches a username prefix or an exact resource type (or resource id, with a type selected).
+AUDIT_ADMIN_LARGE_TABLE = getattr(
+    settings,
+    'AUDIT_ADMIN_LARGE_TABLE',
+    False
+)
+AUDIT_ADMIN_COUNT_LIMIT = getattr(
+    settings,
+    'AUDIT_ADMIN_COUNT_LIMIT',
+    10000
+)
+# 'compact' writes events as CompactAuditEvent rows, with event, resource type and user details stored once in lookup
+#   tables (AuditEventType, AuditResourceType, AuditActor) and referenced by id, instead of as AuditEvent rows.
+AUDIT_STORAGE = getattr(
+    settings,
+    'AUDIT_STORAGE',
+    'default'
+)
+# When True, events recorded inside a transaction are written with a single INSERT after it commits
+#   (transaction.on_commit()) and discarded if it's rolled back, instead of being written as they happen.  So are
+#   their AUDIT_TO_FILE entries.
+AUDIT_ON_COMMIT = getattr(
+    settings,
+    'AUDIT_ON_COMMIT',
+    False
+)
+# Counters & latency histograms of the audit pipeline (see metrics.py) are kept unless AUDIT_METRICS is False.
+#   AUDIT_METRICS_HOOKS: dotted paths of callables called with (<kind>, <name>, <value>, <labels>) for every update,
+#   e.g. to forward them to statsd.  views.audit_metrics serves them in Prometheus text format to staff users or
+#   to requests with an 'Authorization: Bearer <AUDIT_METRICS_TOKEN>' header.
+AUDIT_METRICS = getattr(
+    settings,
+    'AUDIT_METRICS',
+    True
+)
+AUDIT_METRICS_HOOKS = getattr(
+    settings,
+    'AUDIT_METRICS_HOOKS',
+    []
+)
+AUDIT_METRICS_TOKEN = getattr(
+    settings,
+    'AUDIT_METRICS_TOKEN',
+    None
+)
+# When set (seconds), repeats of an event by the same user on the same resource within AUDIT_DEDUP_WINDOW of its first
+#   occurrence are written as a single row, with the number of occurrences (count), their total size and the time of
+#   the last one (last_datetime).  Up to AUDIT_DEDUP_SIZE distinct events are held in memory at once.
+AUDIT_DEDUP_WINDOW = getattr(
+    settings,
+    'AUDIT_DEDUP_WINDOW',
+    None
+)
+AUDIT_DEDUP_SIZE = getattr(
+    settings,
+    'AUDIT_DEDUP_SIZE',
+    10000
+)
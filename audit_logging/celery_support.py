@@ -1,15 +1,22 @@
 from celery import Task
 
 class UserDetailsBase(Task):
-    """ Grabs user_details kwarg if it's available and stores user details in thread-local storage so
+    """ Grabs user_details kwarg if it's available and stores user details in the task's context so
         signal handlers (in particular logging handlers) have access to the details.
+        Buffered audit events (AUDIT_BUFFER_EVENTS) and deduplicated events whose window has passed
+        (AUDIT_DEDUP_WINDOW) are written and looked up user details discarded when the task returns.
     """
     def __call__(self, *args, **kwargs):
-        from audit_logging.utils import audit_logging_thread_local
+        from audit_logging.utils import end_actor_cache, reset_user_details, set_user_details, start_actor_cache
+        from audit_logging.writers import event_deduplicator, flush_deduplicated_events, flush_event_buffer
 
+        token = set_user_details(kwargs.get('user_details'))
+        cache_token = start_actor_cache()
         try:
-            audit_logging_thread_local.user_details = kwargs['user_details']
-        except KeyError:
-            audit_logging_thread_local.user_details = None
-
-        return super(UserDetailsBase, self).__call__(*args, **kwargs)
+            return super(UserDetailsBase, self).__call__(*args, **kwargs)
+        finally:
+            if event_deduplicator.has_expired():
+                flush_deduplicated_events(expired_only=True)
+            flush_event_buffer()
+            end_actor_cache(cache_token)
+            reset_user_details(token)
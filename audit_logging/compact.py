@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Conversion of event records to CompactAuditEvent rows for AUDIT_STORAGE = 'compact', and reading stored events
+    in the AuditEvent form whichever storage they were written with.
+
+    Lookup rows (event types, resource types, actors) are created the first time a value is seen and their ids are
+    cached per process, so writing a batch of events normally doesn't query the lookup tables at all.
+"""
+import functools
+import hashlib
+import json
+import threading
+
+from django.db import router, transaction
+
+from audit_logging.audit_settings import AUDIT_STORAGE
+
+
+STORAGES = ('default', 'compact')
+ACTOR_FIELDS = ('username', 'email', 'fullname', 'superuser', 'staff')
+# AuditEvent fields that CompactAuditEvent keeps in lookup tables, as CompactAuditEvent lookups.
+LOOKUP_FIELDS = dict(
+    [('event', 'event__name'), ('resource_type', 'resource_type__name')] +
+    [(field, 'actor__' + field) for field in ACTOR_FIELDS]
+)
+
+
+class LookupCache(object):
+    """ {<value of key_field>: <lookup row id>} for one lookup model, filled with get_or_create() on a miss.
+        Cleared when it grows past max_size so a long-running process with many distinct actors stays bounded.
+        A row created inside a transaction is only cached once the transaction commits, since after a rollback the
+        id would refer to nothing.
+    """
+    def __init__(self, model_name, key_field='name', max_size=10000):
+        self.model_name = model_name
+        self.key_field = key_field
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.ids = {}
+        # Keys of rows created in a transaction that hasn't committed yet.
+        self.uncommitted = set()
+
+    def get_id(self, key, **defaults):
+        try:
+            return self.ids[key]
+        except KeyError:
+            pass
+        # Import models here so this module can be imported before django apps are ready
+        from audit_logging import models
+        model = getattr(models, self.model_name)
+        instance, created = model.objects.get_or_create(defaults=defaults, **{self.key_field: key})
+        using = router.db_for_write(model)
+        if transaction.get_connection(using).in_atomic_block and (created or key in self.uncommitted):
+            with self.lock:
+                self.uncommitted.add(key)
+            transaction.on_commit(functools.partial(self.add, key, instance.id), using)
+        else:
+            self.add(key, instance.id)
+        return instance.id
+
+    def add(self, key, id):
+        with self.lock:
+            if len(self.ids) >= self.max_size:
+                self.ids.clear()
+            self.ids[key] = id
+            self.uncommitted.discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+            self.uncommitted.clear()
+
+
+event_types = LookupCache('AuditEventType')
+resource_types = LookupCache('AuditResourceType')
+actors = LookupCache('AuditActor', 'key')
+
+
+def clear_caches():
+    for cache in (event_types, resource_types, actors):
+        cache.clear()
+
+
+def actor_key(record):
+    identity = json.dumps([record.get(field) for field in ACTOR_FIELDS])
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def compact_event(record):
+    """ @return: An unsaved CompactAuditEvent for an event record (see utils.build_event_record()).
+    """
+    from audit_logging.models import CompactAuditEvent
+
+    record = dict(record)
+    event = record.pop('event', None)
+    resource_type = record.pop('resource_type', None)
+    actor_details = {field: record.pop(field, None) for field in ACTOR_FIELDS}
+    if any(value is not None for value in actor_details.values()):
+        record['actor_id'] = actors.get_id(actor_key(actor_details), **actor_details)
+    if event is not None:
+        record['event_id'] = event_types.get_id(event)
+    if resource_type is not None:
+        record['resource_type_id'] = resource_types.get_id(resource_type)
+    return CompactAuditEvent(**record)
+
+
+def stored_events(storage=None):
+    """ @param storage: One of STORAGES, default AUDIT_STORAGE.
+        @return: Queryset of the events written with storage: AuditEvent, or CompactAuditEvent with its lookups
+            selected.  Filter it with event_lookup() and read it with readable_events().
+    """
+    from audit_logging.models import AuditEvent, CompactAuditEvent
+
+    storage = storage or AUDIT_STORAGE
+    if storage not in STORAGES:
+        raise ValueError('Unknown audit storage {}, expected one of {}'.format(storage, STORAGES))
+    if storage == 'compact':
+        return CompactAuditEvent.objects.select_related('event', 'actor', 'resource_type')
+    return AuditEvent.objects.all()
+
+
+def event_lookup(model, lookup):
+    """ @return: The lookup on model for an AuditEvent lookup, e.g. 'actor__username__startswith' for
+            'username__startswith' on CompactAuditEvent.
+    """
+    if model.__name__ != 'CompactAuditEvent':
+        return lookup
+    field, separator, rest = lookup.partition('__')
+    return LOOKUP_FIELDS.get(field, field) + separator + rest
+
+
+def readable_events(audit_events):
+    """ @return: [<AuditEvent>, ...] for a list of AuditEvent or CompactAuditEvent objects.
+    """
+    return [
+        audit_event.to_audit_event() if hasattr(audit_event, 'to_audit_event') else audit_event
+        for audit_event in audit_events
+    ]
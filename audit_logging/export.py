@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Streaming CSV / JSON-lines export of stored events (AuditEvent or, with AUDIT_STORAGE = 'compact',
+    CompactAuditEvent rows), shared by the audit_export command and the export view.
+"""
+import csv
+import json
+
+from audit_logging.compact import event_lookup, readable_events
+from audit_logging.utils import get_audit_event_dict, iterate_in_chunks, parse_utc_datetime
+
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+CSV_FIELDS = [
+    'id', 'datetime', 'event', 'username', 'ip', 'email', 'fullname', 'superuser', 'staff',
+    'resource_type', 'resource_uuid', 'resource_title', 'count', 'size', 'last_datetime'
+]
+# Filter names accepted by filter_audit_events(), as used for command options & query string parameters.
+FILTERS = ('since', 'until', 'username', 'event', 'resource_type', 'resource_uuid')
+
+
+def filter_audit_events(queryset, since=None, until=None, username=None, event=None, resource_type=None,
+                        resource_uuid=None):
+    """ Narrows an AuditEvent or CompactAuditEvent queryset; since (inclusive) & until (exclusive) are date/datetime
+        strings.
+        @raise ValueError: If since or until can't be parsed.
+    """
+    for name, value, lookup in [('since', since, 'datetime__gte'), ('until', until, 'datetime__lt')]:
+        if value:
+            dt = parse_utc_datetime(value)
+            if dt is None:
+                raise ValueError('Could not parse {} {}'.format(name, value))
+            queryset = queryset.filter(**{lookup: dt})
+    for field, value in [
+        ('username', username), ('event', event), ('resource_type', resource_type), ('resource_uuid', resource_uuid)
+    ]:
+        if value:
+            queryset = queryset.filter(**{event_lookup(queryset.model, field): value})
+    return queryset
+
+
+class Echo(object):
+    """ File-like object whose write() returns what it's given, so csv.writer can produce strings for streaming.
+    """
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, format='csv', chunk_size=1000):
+    """ Yields the rows of queryset as lines of CSV (with a header line) or JSON, fetching chunk_size rows at a time
+        so memory use doesn't depend on the number of rows.
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format {}, expected one of {}'.format(format, FORMATS))
+
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_FIELDS)
+        for chunk in iterate_in_chunks(queryset, chunk_size):
+            for audit_event in readable_events(chunk):
+                yield writer.writerow([getattr(audit_event, field) for field in CSV_FIELDS])
+    else:
+        for chunk in iterate_in_chunks(queryset, chunk_size):
+            for audit_event in readable_events(chunk):
+                yield json.dumps(get_audit_event_dict(audit_event), sort_keys=True) + '\n'
@@ -1,108 +1,212 @@
 """ Provides alterntive open() & File objects which log create/read/update/delete.
 """
 import os
+import time
 from audit_logging.models import AuditEvent
 import logging
 from django.db import connection
 from django.conf import settings
+from audit_logging.audit_settings import AUDIT_FILE_EVENTS_AGGREGATE, AUDIT_FILE_EVENTS_AGGREGATE_INTERVAL
 from audit_logging.utils import log_event
 
 
 logger = logging.getLogger(__name__)
 
 
-def logging_open(filepath, mode='r', user_details=None):
+def logging_open(filepath, mode='r', user_details=None, **kwargs):
     """ Equivalent of builtin open() which logs file creation to AuditEvent if appropriate and returns a LoggingFile
         instead of regular file-like object.
+        filepath may be a path (str, bytes or os.PathLike) or a file descriptor; other open() arguments (buffering,
+        encoding, newline, ...) are passed through as keyword arguments.
     """
-    exists_before = os.path.exists(filepath)
-    res = open(filepath, mode)
+    if not getattr(settings, 'AUDIT_FILE_EVENTS', True):
+        return open(filepath, mode, **kwargs)
 
-    if getattr(settings, 'AUDIT_FILE_EVENTS', True):
-        res = LoggingFile(res, user_details)
-        exists_after = os.path.exists(filepath)
+    res, created = open_detecting_creation(filepath, mode, **kwargs)
+    res = LoggingFile(res, user_details)
 
-        if not exists_before and exists_after:
-            # This is just to make it easier to trace when user_details haven't been sent
-            if user_details is None:
-                user_details = {'username': 'unknown-logging_open'}
-            log_event(event='FileCreate', resource_type='file', resource_uuid=filepath, user_details=user_details)
+    if created:
+        # This is just to make it easier to trace when user_details haven't been sent
+        if user_details is None:
+            user_details = {'username': 'unknown-logging_open'}
+        log_event(event='FileCreate', resource_type='file', resource_uuid=res.name, user_details=user_details)
 
     return res
 
 
+def open_detecting_creation(filepath, mode='r', **kwargs):
+    """ Opens filepath like builtin open(), working out whether the open created it from the mode rather than by
+        checking for the file before and after: read modes never create, 'x' always does, 'w' is first tried
+        as an exclusive create and 'a' (which must keep O_APPEND) costs a single stat beforehand.
+        @return: (<file object>, <created>)
+    """
+    if isinstance(filepath, int) or not ('w' in mode or 'a' in mode or 'x' in mode):
+        return open(filepath, mode, **kwargs), False
+
+    if 'x' in mode:
+        return open(filepath, mode, **kwargs), True
+
+    if 'w' in mode:
+        try:
+            return open(filepath, mode.replace('w', 'x'), **kwargs), True
+        except FileExistsError:
+            return open(filepath, mode, **kwargs), False
+
+    exists_before = os.path.exists(filepath)
+    return open(filepath, mode, **kwargs), not exists_before
+
+
 class LoggingFile(object):
-    """ Wraps a regular file-like object so that reads/writes are logged to AuditEvent.
+    """ Wraps a regular file-like object so that reads/writes are logged to AuditEvent, with their size in bytes
+        (text is counted in the file's encoding).
+        With aggregate=True reads & writes are totalled and logged as (at most) one FileRead and one FileWrite
+        event when the file is closed (or the LoggingFile is garbage collected without being closed), or whenever
+        aggregate_interval seconds have passed if it isn't None.
     """
     AuditEvent = None
 
-    def __init__(self, regular_file, user_details):
+    def __init__(self, regular_file, user_details, aggregate=AUDIT_FILE_EVENTS_AGGREGATE,
+                 aggregate_interval=AUDIT_FILE_EVENTS_AGGREGATE_INTERVAL):
         """ regular_file should be an open file-like object
         """
         # Import AuditEvent here so this module can be imported before django apps are ready
         from audit_logging.models import AuditEvent
         self.AuditEvent = AuditEvent
         self.regular_file = regular_file
+        # Text read or written is counted in this encoding, as the file stores it.
+        self.text_encoding = getattr(regular_file, 'encoding', None) or 'utf-8'
+        self.text_errors = getattr(regular_file, 'errors', None) or 'strict'
         self.user_details = user_details
+        self.aggregate = aggregate
+        self.aggregate_interval = aggregate_interval
+        # {<event>: [<call count>, <total size>], ...} of calls not yet logged when aggregating
+        self.totals = {'FileRead': [0, 0], 'FileWrite': [0, 0]}
+        self.last_logged = time.time()
+        # [<lines>, <total size>] read through __next__() and not logged yet
+        self.next_totals = [0, 0]
+
+    def byte_size(self, data):
+        """ @return: Size in bytes of data read or written, a str or a bytes-like object.
+        """
+        if isinstance(data, str):
+            return len(data.encode(self.text_encoding, self.text_errors))
+        return len(data)
+
+    def log_call(self, event, size, count=1):
+        if not self.aggregate:
+            log_event(
+                event=event, resource_type='file', resource_uuid=self.regular_file.name,
+                user_details=self.user_details, count=count, size=size
+            )
+            return
+
+        totals = self.totals[event]
+        totals[0] += count
+        totals[1] += size
+        if self.aggregate_interval is not None and time.time() - self.last_logged >= self.aggregate_interval:
+            self.log_totals()
+
+    def log_totals(self):
+        """ Logs aggregated reads & writes not logged yet.
+        """
+        self.last_logged = time.time()
+        for event, totals in self.totals.items():
+            count, size = totals
+            if count:
+                log_event(
+                    event=event, resource_type='file', resource_uuid=self.regular_file.name,
+                    user_details=self.user_details, count=count, size=size
+                )
+                totals[0] = totals[1] = 0
 
     def write(self, *args, **kwargs):
         res = self.regular_file.write(*args, **kwargs)
-        log_event(
-            event='FileWrite', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+        # A text file's write() returns the number of characters.
+        size = res if res is not None and not isinstance(args[0], str) else self.byte_size(args[0])
+        self.log_call('FileWrite', size)
         return res
 
-    def writelines(self, *args, **kwargs):
-        res = self.regular_file.writelines(*args, **kwargs)
-        log_event(
-            event='FileWrite', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+    def writelines(self, lines, *args, **kwargs):
+        lines = list(lines)
+        res = self.regular_file.writelines(lines, *args, **kwargs)
+        self.log_call('FileWrite', sum(self.byte_size(line) for line in lines))
         return res
 
     def truncate(self, *args, **kwargs):
         res = self.regular_file.truncate(*args, **kwargs)
-        log_event(
-            event='FileWrite', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+        self.log_call('FileWrite', 0)
         return res
 
     def read(self, *args, **kwargs):
         res = self.regular_file.read(*args, **kwargs)
-        log_event(
-            event='FileRead', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+        self.log_call('FileRead', self.byte_size(res))
         return res
 
     def readline(self, *args, **kwargs):
         res = self.regular_file.readline(*args, **kwargs)
-        log_event(
-            event='FileRead', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+        self.log_call('FileRead', self.byte_size(res))
         return res
 
     def readlines(self, *args, **kwargs):
         res = self.regular_file.readlines(*args, **kwargs)
-        log_event(event='FileRead', resource_type='file', resource_uuid=self.regular_file.name,
-            user_details=self.user_details
-        )
+        self.log_call('FileRead', sum(self.byte_size(line) for line in res))
         return res
 
+    def log_next_totals(self):
+        lines, size = self.next_totals
+        if lines:
+            self.next_totals = [0, 0]
+            self.log_call('FileRead', size, count=lines)
+
+    def close(self):
+        self.log_next_totals()
+        if self.aggregate:
+            self.log_totals()
+        return self.regular_file.close()
+
+    def __del__(self):
+        """ Logs the reads & writes of a LoggingFile dropped without being closed (the wrapped file closes itself
+            when it's collected), which would otherwise never be logged.
+        """
+        if 'totals' not in self.__dict__:
+            # __init__() didn't finish.
+            return
+        try:
+            self.log_next_totals()
+            if self.aggregate:
+                self.log_totals()
+        except Exception:
+            logger.exception('Exception logging the reads & writes of an unclosed LoggingFile.')
+
     def __enter__(self, *args, **kwargs):
         return self
 
     def __exit__(self, *args, **kwargs):
-        self.regular_file.close()
-
-    def __iter__(self, *args, **kwargs):
-        return self.regular_file.__iter__(*args, **kwargs)
+        self.close()
 
-    def __next__(self, *args, **kwargs):
-        return self.regular_file.__next__(*args, **kwargs)
+    def __iter__(self):
+        """ Yields lines from the file, logging a single FileRead for all of them (count is the number of lines)
+            when iteration finishes or is abandoned.
+        """
+        lines = size = 0
+        try:
+            for line in self.regular_file:
+                lines += 1
+                size += self.byte_size(line)
+                yield line
+        finally:
+            if lines:
+                self.log_call('FileRead', size, count=lines)
+
+    def __next__(self):
+        try:
+            line = self.regular_file.__next__()
+        except StopIteration:
+            self.log_next_totals()
+            raise
+        self.next_totals[0] += 1
+        self.next_totals[1] += self.byte_size(line)
+        return line
 
     def __getattr__(self, attr):
         if hasattr(self.regular_file, attr):
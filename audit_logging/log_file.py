@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Long-lived JSON-lines file used for AUDIT_TO_FILE output.
+"""
+import atexit
+from datetime import datetime
+import gzip
+import io
+import json
+from logging import getLogger
+import os
+import shutil
+import signal
+import threading
+import time
+
+from audit_logging.audit_settings import (
+    AUDIT_LOGFILE_LOCATION, AUDIT_LOGFILE_BUFFER_SIZE, AUDIT_LOGFILE_FLUSH_INTERVAL, AUDIT_LOGFILE_FSYNC,
+    AUDIT_LOGFILE_MAX_BYTES, AUDIT_LOGFILE_ROTATE_DAILY, AUDIT_LOGFILE_COMPRESSION
+)
+from audit_logging.metrics import metrics
+
+
+logger = getLogger(__name__)
+
+
+class AuditLogFile(object):
+    """ Appends one JSON document per line to location, keeping the file open between entries.
+        The file is opened with O_APPEND and buffered lines are written with a single write() so whole lines from
+        different threads and worker processes don't interleave.  A forked child discards lines buffered by its
+        parent and opens its own descriptor.
+        Buffered lines are written once buffer_size bytes are pending, and otherwise by a timer flush_interval
+        seconds after the first of them, so an idle process doesn't keep them in memory.
+        When max_bytes or rotate_daily is set the file is rotated into segments (see rotate()); processes sharing
+        the file coordinate through an flock() on '<location>.lock' so no process writes to a segment once it has
+        been closed.  Closed segments are compressed and added to the manifest by a separate thread, so writers
+        aren't held up meanwhile.
+    """
+    def __init__(self, location=AUDIT_LOGFILE_LOCATION, buffer_size=AUDIT_LOGFILE_BUFFER_SIZE,
+                 flush_interval=AUDIT_LOGFILE_FLUSH_INTERVAL, fsync=AUDIT_LOGFILE_FSYNC,
+                 max_bytes=AUDIT_LOGFILE_MAX_BYTES, rotate_daily=AUDIT_LOGFILE_ROTATE_DAILY,
+                 compression=AUDIT_LOGFILE_COMPRESSION):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError('Unknown audit log compression {}, expected one of {}'.format(
+                compression, list(COMPRESSION_EXTENSIONS)
+            ))
+        self.location = location
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.fd = None
+        self.lock_fd = None
+        self.pid = os.getpid()
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time.time()
+        self.flush_timer = None
+        self.segment_threads = []
+        self.reopen_requested = False
+
+    def write(self, d):
+        line = json.dumps(d, sort_keys=True).encode('utf-8') + b'\n'
+        with self.lock:
+            self.check_process()
+            self.pending.append(line)
+            self.pending_bytes += len(line)
+            if self.pending_bytes >= self.buffer_size or time.time() - self.last_flush >= self.flush_interval:
+                self._flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.flush_interval, self.flush_on_timer)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush_on_timer(self):
+        try:
+            with self.lock:
+                self.flush_timer = None
+                self.check_process()
+                self._flush()
+        except Exception as ex:
+            logger.exception('Exception flushing audit log file.')
+            metrics.count_error('file_flush', ex)
+
+    def flush(self):
+        with self.lock:
+            self.check_process()
+            self._flush()
+
+    def reopen(self):
+        """ Closes and reopens the file before the next write, e.g. after it has been moved by logrotate.
+            Only sets a flag so it is safe to call from a signal handler.
+        """
+        self.reopen_requested = True
+
+    def close(self):
+        with self.lock:
+            self.check_process()
+            self._flush()
+            self._close()
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            segment_threads, self.segment_threads = self.segment_threads, []
+        for thread in segment_threads:
+            thread.join()
+
+    def check_process(self):
+        """ Drops state inherited from a parent process; call with lock held.
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.pending = []
+            self.pending_bytes = 0
+            # The parent's timer thread isn't running in this process.
+            self.flush_timer = None
+            self._close()
+
+    @property
+    def rotates(self):
+        return bool(self.max_bytes or self.rotate_daily)
+
+    def _open(self):
+        if self.reopen_requested or (self.fd is not None and self.rotates and self._replaced()):
+            self.reopen_requested = False
+            self._close_fd()
+        if self.fd is None:
+            self.fd = os.open(self.location, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self.fd
+
+    def _replaced(self):
+        """ True if location no longer refers to the open file, i.e. another process has rotated it.
+        """
+        try:
+            return os.stat(self.location).st_ino != os.fstat(self.fd).st_ino
+        except OSError:
+            return True
+
+    def _close(self):
+        self._close_fd()
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def _close_fd(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def _rotation_lock(self, operation):
+        import fcntl
+        if self.lock_fd is None:
+            self.lock_fd = os.open('{}.lock'.format(self.location), os.O_WRONLY | os.O_CREAT, 0o644)
+        fcntl.flock(self.lock_fd, operation)
+
+    def _rotation_due(self, fd, size):
+        stat = os.fstat(fd)
+        if stat.st_size == 0:
+            return False
+        if self.max_bytes and stat.st_size + size > self.max_bytes:
+            return True
+        if self.rotate_daily and datetime.utcfromtimestamp(stat.st_mtime).date() != datetime.utcnow().date():
+            return True
+        return False
+
+    def _write(self, data):
+        if not self.rotates:
+            return self._write_fd(self._open(), data)
+
+        # Imported here since fcntl isn't available on Windows, where rotation isn't supported.
+        import fcntl
+        closed_segment = None
+        self._rotation_lock(fcntl.LOCK_SH)
+        try:
+            fd = self._open()
+            if self._rotation_due(fd, len(data)):
+                # Writers hold the shared lock while writing, so once the exclusive lock is granted no process is
+                #   part way through writing to the file being rotated.
+                self._rotation_lock(fcntl.LOCK_EX)
+                fd = self._open()
+                if self._rotation_due(fd, len(data)):
+                    closed_segment = self.rotate()
+                    fd = self._open()
+            self._write_fd(fd, data)
+        finally:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+        if closed_segment is not None:
+            # Not a daemon thread, so the interpreter finishes closing the segment before exiting.
+            thread = threading.Thread(
+                target=close_segment, args=(closed_segment, self.location, self.compression),
+                name='audit-log-segment'
+            )
+            thread.start()
+            self.segment_threads = [t for t in self.segment_threads if t.is_alive()] + [thread]
+
+    def _write_fd(self, fd, data):
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+        if self.fsync:
+            os.fsync(fd)
+
+    def rotate(self):
+        """ Moves the file to a new segment named for the current UTC time; call with the exclusive rotation lock.
+            @return: Location of the new segment, ready for close_segment().
+        """
+        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        segment = '{}.{}'.format(self.location, timestamp)
+        suffix = 0
+        while any(os.path.exists(segment + ext) for ext in COMPRESSION_EXTENSIONS.values()):
+            suffix += 1
+            segment = '{}.{}-{}'.format(self.location, timestamp, suffix)
+        os.rename(self.location, segment)
+        self._close_fd()
+        return segment
+
+    def _flush(self):
+        self.last_flush = time.time()
+        if not self.pending:
+            return
+
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self._write(data)
+
+
+# {<compression>: <segment file extension>, ...}
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def manifest_location(location=AUDIT_LOGFILE_LOCATION):
+    return '{}.manifest.json'.format(location)
+
+
+def read_manifest(location=AUDIT_LOGFILE_LOCATION):
+    """ @return: [{'segment': <filename>, 'first_event_time_gmt': ..., 'last_event_time_gmt': ..., 'bytes': ...}, ...]
+            oldest first.  Segment filenames are relative to the directory of location.
+    """
+    try:
+        with open(manifest_location(location)) as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return []
+
+
+def segments_between(start=None, end=None, location=AUDIT_LOGFILE_LOCATION):
+    """ Returns the paths of segments which may hold entries with start <= event_time_gmt <= end, followed by the
+        live log file, so readers can skip segments outside a time range without opening them.
+        start & end are strings in the format returned by utils.get_time_gmt(), which sort chronologically.
+    """
+    directory = os.path.dirname(location)
+    paths = []
+    for segment in read_manifest(location):
+        first, last = segment.get('first_event_time_gmt'), segment.get('last_event_time_gmt')
+        if start is not None and last is not None and last < start:
+            continue
+        if end is not None and first is not None and first > end:
+            continue
+        paths.append(os.path.join(directory, segment['segment']))
+    if os.path.exists(location):
+        paths.append(location)
+    return paths
+
+
+def open_segment(path):
+    """ Opens a (possibly compressed) segment or the live log file for reading text.
+    """
+    if path.endswith(COMPRESSION_EXTENSIONS['gzip']):
+        return gzip.open(path, 'rt')
+    if path.endswith(COMPRESSION_EXTENSIONS['zstd']):
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+    return open(path)
+
+
+def close_segment(segment, location=AUDIT_LOGFILE_LOCATION, compression=None):
+    """ Compresses a segment moved aside by AuditLogFile.rotate() and adds it to the manifest.
+    """
+    import fcntl
+    try:
+        size = os.path.getsize(segment)
+        first_event_time_gmt, last_event_time_gmt = segment_time_range(segment)
+        if compression is not None:
+            compressed = segment + COMPRESSION_EXTENSIONS[compression]
+            compress(segment, compressed, compression)
+            os.remove(segment)
+            segment = compressed
+
+        # Hold the rotation lock exclusively so processes closing segments at the same time don't lose entries.
+        lock_fd = os.open('{}.lock'.format(location), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            manifest = read_manifest(location)
+            manifest.append({
+                'segment': os.path.basename(segment),
+                'first_event_time_gmt': first_event_time_gmt,
+                'last_event_time_gmt': last_event_time_gmt,
+                'bytes': size,
+            })
+            # Segments closed by different threads/processes may finish in any order.
+            manifest.sort(key=segment_sort_key)
+            replacement = '{}.{}'.format(manifest_location(location), os.getpid())
+            with open(replacement, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.rename(replacement, manifest_location(location))
+        finally:
+            os.close(lock_fd)
+    except Exception:
+        logger.exception('Exception closing audit log segment {}.'.format(segment))
+
+
+def segment_sort_key(entry):
+    """ Orders manifest entries by rotation time: the segment name without its compression extension.
+    """
+    name = entry['segment']
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if extension and name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def compress(source, destination, compression):
+    with open(source, 'rb') as src:
+        if compression == 'gzip':
+            with gzip.open(destination, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            import zstandard
+            with open(destination, 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+
+
+def segment_time_range(path):
+    """ @return: (first event_time_gmt, last event_time_gmt) in an uncompressed segment, reading only its first and
+            last lines.
+    """
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = max(0, end - 4096)
+        f.seek(position)
+        tail = f.read().rstrip(b'\n')
+        last_line = tail.rsplit(b'\n', 1)[-1]
+
+    def event_time(line):
+        try:
+            return json.loads(line.decode('utf-8')).get('event_time_gmt')
+        except ValueError:
+            return None
+
+    return event_time(first_line), event_time(last_line)
+
+
+audit_log_file = AuditLogFile()
+
+
+def flush_audit_log_file():
+    try:
+        audit_log_file.flush()
+    except Exception as ex:
+        logger.exception('Exception flushing audit log file.')
+        metrics.count_error('file_flush', ex)
+
+
+atexit.register(flush_audit_log_file)
+
+
+def install_sighup_handler():
+    """ Reopens the audit log file on SIGHUP, calling any previously installed handler as well.
+        Must be called from the main thread.
+    """
+    previous_handler = signal.getsignal(signal.SIGHUP)
+
+    def reopen_audit_log_file(signum, frame):
+        audit_log_file.reopen()
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+
+    signal.signal(signal.SIGHUP, reopen_audit_log_file)
@@ -0,0 +1,125 @@
+from datetime import timedelta
+import gzip
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from audit_logging.audit_settings import AUDIT_STORAGE
+from audit_logging.compact import STORAGES, readable_events, stored_events
+from audit_logging.utils import get_audit_event_dict, iterate_in_chunks, parse_utc_datetime
+
+
+class Command(BaseCommand):
+    help = (
+        'Archives stored events older than a cutoff to gzipped JSON lines (the format written for AUDIT_TO_FILE) '
+        'and deletes them, one primary-key ordered chunk at a time.  An interrupted run resumes from its checkpoint '
+        'file when run again.'
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--before', help='Archive events before this date or ISO 8601 datetime (UTC if naive).')
+        cutoff.add_argument('--older-than-days', type=int, help='Archive events older than this many days.')
+        parser.add_argument(
+            '--output',
+            help='Archive file to append to (default audit_archive_<cutoff day>.json.gz); pass the same file to resume.'
+        )
+        parser.add_argument('--checkpoint', help='Checkpoint file (default <output>.checkpoint).')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between chunks.')
+        parser.add_argument('--keep', action='store_true', help="Archive without deleting archived rows.")
+        parser.add_argument(
+            '--storage', choices=STORAGES,
+            help='Archive AuditEvent (default) or CompactAuditEvent (compact) rows (default AUDIT_STORAGE).'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = self.get_cutoff(options)
+        storage = options['storage'] or AUDIT_STORAGE
+        # Named for the day so a rerun with --older-than-days finds the checkpoint of an interrupted run that day.
+        output = options['output'] or 'audit_archive_{}{}.json.gz'.format(
+            'compact_' if storage == 'compact' else '', cutoff.strftime('%Y%m%d')
+        )
+        checkpoint_location = options['checkpoint'] or '{}.checkpoint'.format(output)
+        delete = not options['keep']
+
+        checkpoint = self.read_checkpoint(checkpoint_location)
+        last_pk = None
+        if checkpoint is not None:
+            cutoff = parse_datetime(checkpoint['cutoff'])
+            last_pk = checkpoint['last_pk']
+            storage = checkpoint.get('storage', 'default')
+            self.stdout.write('Resuming archive of events before {} after id {}'.format(cutoff, last_pk))
+            # Drops a chunk written after the last checkpoint, which is archived again below.
+            if os.path.exists(output) and os.path.getsize(output) > checkpoint['archive_bytes']:
+                with open(output, 'r+b') as f:
+                    f.truncate(checkpoint['archive_bytes'])
+            if delete and last_pk is not None:
+                # Rows archived before the interruption that weren't deleted yet.
+                self.delete(
+                    stored_events(storage).filter(pk__lte=last_pk, datetime__lt=cutoff), options['chunk_size']
+                )
+        else:
+            # Records where the archive started, in case the run is interrupted during the first chunk.
+            self.write_checkpoint(checkpoint_location, cutoff, None, output, storage)
+
+        queryset = stored_events(storage).filter(datetime__lt=cutoff)
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+
+        archived = 0
+        for chunk in iterate_in_chunks(queryset, options['chunk_size']):
+            # Each chunk is a complete gzip member, so the archive is readable up to the last finished chunk.
+            with gzip.open(output, 'at') as f:
+                for audit_event in readable_events(chunk):
+                    f.write(json.dumps(get_audit_event_dict(audit_event), sort_keys=True))
+                    f.write('\n')
+            self.write_checkpoint(checkpoint_location, cutoff, chunk[-1].pk, output, storage)
+            if delete:
+                with transaction.atomic():
+                    queryset.model.objects.filter(pk__in=[audit_event.pk for audit_event in chunk]).delete()
+            archived += len(chunk)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if os.path.exists(checkpoint_location):
+            os.remove(checkpoint_location)
+        self.stdout.write('Archived {} events before {} to {}'.format(archived, cutoff, output))
+
+    def get_cutoff(self, options):
+        if options['older_than_days'] is not None:
+            return timezone.now() - timedelta(days=options['older_than_days'])
+        if options['before'] is None:
+            raise CommandError('One of --before or --older-than-days is required.')
+
+        cutoff = parse_utc_datetime(options['before'])
+        if cutoff is None:
+            raise CommandError('Could not parse --before {}'.format(options['before']))
+        return cutoff
+
+    def delete(self, queryset, chunk_size):
+        for chunk in iterate_in_chunks(queryset.select_related(None).only('pk'), chunk_size):
+            with transaction.atomic():
+                queryset.model.objects.filter(pk__in=[audit_event.pk for audit_event in chunk]).delete()
+
+    def read_checkpoint(self, location):
+        if not os.path.exists(location):
+            return None
+        with open(location) as f:
+            return json.load(f)
+
+    def write_checkpoint(self, location, cutoff, last_pk, output, storage):
+        """ Records the last archived id and the size of the archive up to it.
+        """
+        archive_bytes = os.path.getsize(output) if os.path.exists(output) else 0
+        replacement = '{}.tmp'.format(location)
+        with open(replacement, 'w') as f:
+            json.dump({
+                'cutoff': cutoff.isoformat(), 'last_pk': last_pk, 'archive_bytes': archive_bytes, 'storage': storage
+            }, f)
+        os.rename(replacement, location)
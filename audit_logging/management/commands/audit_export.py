@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from audit_logging.compact import STORAGES, stored_events
+from audit_logging.export import FORMATS, export_lines, filter_audit_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports stored events as CSV or JSON lines, reading them in primary-key ordered chunks so memory use stays '
+        'constant however many rows match.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write (default stdout).')
+        parser.add_argument('--since', help='Only events at or after this date or ISO 8601 datetime (UTC if naive).')
+        parser.add_argument('--until', help='Only events before this date or ISO 8601 datetime (UTC if naive).')
+        parser.add_argument('--username')
+        parser.add_argument('--event')
+        parser.add_argument('--resource-type')
+        parser.add_argument('--resource-uuid')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--storage', choices=STORAGES,
+            help='Export AuditEvent (default) or CompactAuditEvent (compact) rows (default AUDIT_STORAGE).'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            queryset = filter_audit_events(
+                stored_events(options['storage']), since=options['since'], until=options['until'],
+                username=options['username'], event=options['event'], resource_type=options['resource_type'],
+                resource_uuid=options['resource_uuid']
+            )
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        lines = export_lines(queryset, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from audit_logging.audit_settings import AUDIT_PARTITION_PERIOD, AUDIT_RETENTION_PERIODS, AUDIT_PARTITIONS_AHEAD
+from audit_logging.compact import STORAGES
+from audit_logging.partitioning import PERIODS, get_partitioner, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Maintains time-partitioned event storage: creates upcoming partitions (PostgreSQL) or rolls the table '
+        'over at the end of each period (other databases), then drops partitions/tables holding only expired events.  '
+        'Run it daily, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup', action='store_true',
+            help='PostgreSQL only: convert the event table to a partitioned table (once).'
+        )
+        parser.add_argument('--period', choices=PERIODS, default=AUDIT_PARTITION_PERIOD)
+        parser.add_argument(
+            '--ahead', type=int, default=AUDIT_PARTITIONS_AHEAD,
+            help='Number of future PostgreSQL partitions to create in advance.'
+        )
+        parser.add_argument(
+            '--retain', type=int, default=AUDIT_RETENTION_PERIODS,
+            help='Drop partitions/tables with only events from before the last RETAIN periods.'
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--storage', choices=STORAGES,
+            help='Partition the AuditEvent (default) or CompactAuditEvent (compact) table (default AUDIT_STORAGE).'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be done without creating, renaming or dropping any table.'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        partitioner = get_partitioner(connection, options['period'], options['storage'])
+        now = timezone.now()
+        dry_run = options['dry_run']
+
+        if connection.vendor == 'postgresql':
+            set_up = partitioner.is_set_up()
+            if options['setup'] and not set_up:
+                if dry_run:
+                    self.stdout.write('Would convert {} to a partitioned table'.format(partitioner.table))
+                    return
+                self.stdout.write('Converting {} to a partitioned table'.format(partitioner.table))
+                partitioner.setup(now)
+            elif not set_up:
+                raise CommandError('{} is not partitioned yet, run with --setup first.'.format(partitioner.table))
+            for name in partitioner.create_ahead(now, options['ahead'], dry_run):
+                self.stdout.write('{} partition {}'.format('Would create' if dry_run else 'Created', name))
+        elif options['setup']:
+            raise CommandError('--setup is only needed for PostgreSQL; other databases use rolling tables.')
+        elif partitioner.rotation_due(now):
+            if dry_run:
+                self.stdout.write('Would roll {} over to {}'.format(partitioner.table, partitioner.rolled_name(now)))
+            else:
+                self.stdout.write('Rolled {} over to {}'.format(partitioner.table, partitioner.rotate(now)))
+
+        if options['retain'] is not None:
+            cutoff = retention_cutoff(now, options['period'], options['retain'])
+            for name in partitioner.expired(cutoff):
+                if not dry_run:
+                    partitioner.drop(name)
+                self.stdout.write('{} expired table {}'.format('Would drop' if dry_run else 'Dropped', name))
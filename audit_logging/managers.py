@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Auditing of bulk ORM operations, which don't send post_save for each instance (or, for delete(), send one
+    post_delete per row that would otherwise be written separately).
+
+    class Layer(models.Model):
+        objects = AuditedManager()
+
+    Each operation records one event per affected row, written together with a single INSERT.
+"""
+from logging import getLogger
+
+from django.db import models
+
+from audit_logging.audit_settings import AUDIT_TO_FILE
+from audit_logging.metrics import metrics
+from audit_logging.utils import (
+    build_event_record, collect_events, get_model_resource_type, get_owner_usernames, get_resource,
+    get_resource_id_field, get_time_gmt, get_user_details, is_event_audited, save_events, write_entry
+)
+
+
+logger = getLogger(__name__)
+
+
+def log_bulk_event(model, event, resource_ids, instances=None):
+    """ Records event for each of resource_ids of model (an audited model) with a single save_events().
+        instances, if given, are the instances resource_ids belong to, used for their owners in the AUDIT_TO_FILE log.
+    """
+    resource_type = get_model_resource_type(model)
+    if resource_type is None or not resource_ids:
+        return
+    try:
+        if AUDIT_TO_FILE:
+            usernames = get_owner_usernames(instances) if instances else [None] * len(resource_ids)
+            for resource_id, username in zip(resource_ids, usernames):
+                write_entry({
+                    'resource': {'id': resource_id, 'type': resource_type, 'username': username},
+                    'event': event,
+                    'event_time_gmt': get_time_gmt(),
+                })
+        user_details = get_user_details()
+        save_events([
+            build_event_record(
+                event=event, resource_type=resource_type, resource_uuid=resource_id, user_details=user_details
+            )
+            for resource_id in resource_ids
+        ])
+    except Exception as ex:
+        logger.exception('Exception recording bulk {} of {}.'.format(event, model.__name__))
+        metrics.count_error('bulk', ex)
+
+
+class AuditedQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        """ Records an 'update' event for each updated row.  The ids are read before the UPDATE, so rows only
+            matching afterwards aren't included.
+        """
+        if get_model_resource_type(self.model) is None or not is_event_audited(self.model, 'update', kwargs):
+            return super(AuditedQuerySet, self).update(**kwargs)
+        id_field = get_resource_id_field(self.model)
+        resource_ids = list(self.values_list(id_field, flat=True))
+        rows = super(AuditedQuerySet, self).update(**kwargs)
+        log_bulk_event(self.model, 'update', resource_ids)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        """ The 'delete' events recorded by the post_delete signal for each deleted instance (including cascades)
+            are written together once the delete succeeds.
+        """
+        with collect_events():
+            return super(AuditedQuerySet, self).delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """ Records a 'create' event for each object.  Where the database doesn't return the new primary keys
+            (anything but PostgreSQL) an id_field of 'id' is recorded as None.
+        """
+        objs = super(AuditedQuerySet, self).bulk_create(objs, *args, **kwargs)
+        if is_event_audited(self.model, 'create'):
+            self.log_instances('create', objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        """ Records an 'update' event for each object (Django 2.2+).
+        """
+        rows = super(AuditedQuerySet, self).bulk_update(objs, fields, *args, **kwargs)
+        if is_event_audited(self.model, 'update', fields):
+            self.log_instances('update', objs)
+        return rows
+
+    def log_instances(self, event, objs):
+        objs = list(objs)
+        if get_model_resource_type(self.model) is None:
+            return
+        resource_ids = [get_resource(obj, resolve_username=False)['id'] for obj in objs]
+        log_bulk_event(self.model, event, resource_ids, objs)
+
+
+class AuditedManager(models.Manager.from_queryset(AuditedQuerySet)):
+    pass
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Counters and latency histograms for the audit pipeline, per process, exportable in Prometheus text format
+    (see views.audit_metrics) and passed to the hooks in AUDIT_METRICS_HOOKS as they're recorded.
+
+    audit_events_total{event}: Event records saved.
+    audit_event_seconds{event}: Time spent recording an event (building & saving its record, file log included).
+    audit_sink_seconds{sink}, audit_sink_events_total{sink}: Writes to the database ('db') and the AUDIT_TO_FILE
+        log ('file').
+    audit_errors_total{stage, error}: Exceptions caught (and logged) while auditing, by exception class.
+    audit_async_events_total{outcome}, audit_async_queue_depth: AUDIT_ASYNC background writer.
+    audit_buffer_pending: Records waiting in the AUDIT_BUFFER_EVENTS buffer.
+    audit_dedup_held, audit_dedup_merged_total{event}: Records held by AUDIT_DEDUP_WINDOW deduplication and the
+        repeats collapsed into them.
+"""
+from contextlib import contextmanager
+from importlib import import_module
+from logging import getLogger
+import threading
+import time
+
+from audit_logging.audit_settings import AUDIT_METRICS, AUDIT_METRICS_HOOKS
+
+
+logger = getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, besides +Inf.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+HELP = {
+    'audit_events_total': 'Audit event records saved.',
+    'audit_event_seconds': 'Time spent recording an audit event.',
+    'audit_sink_seconds': 'Time spent writing audit events to a sink.',
+    'audit_sink_events_total': 'Audit events written to a sink.',
+    'audit_errors_total': 'Exceptions caught while auditing.',
+    'audit_async_events_total': 'Audit events handled by the background writer, by outcome.',
+    'audit_async_queue_depth': 'Audit events queued for the background writer.',
+    'audit_buffer_pending': 'Audit events waiting in the event buffer.',
+    'audit_dedup_held': 'Audit events held for deduplication.',
+    'audit_dedup_merged_total': 'Repeated audit events collapsed into a held event.',
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = '' if value is None else str(value)
+        escaped.append('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')))
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+    """ Thread-safe store of counters & histograms keyed by (<name>, <sorted label items>).
+        Collectors (callables returning [(<name>, <'counter' or 'gauge'>, <labels dict>, <value>), ...]) add values
+        owned elsewhere, such as queue depths, when the metrics are exported.
+        Hooks are called with (<'counter' or 'histogram'>, <name>, <value>, <labels dict>) for every update.
+    """
+    def __init__(self, enabled=AUDIT_METRICS, hooks=AUDIT_METRICS_HOOKS):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        # {<key>: [<count per bucket>..., <count>, <sum>]}
+        self.histograms = {}
+        self.collectors = []
+        self.hook_paths = list(hooks)
+        self.hooks = None
+
+    def increment(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.call_hooks('counter', name, amount, labels)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+        self.call_hooks('histogram', name, seconds, labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ Observes the time the block takes, whether or not it raises.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def count_error(self, stage, exception):
+        self.increment('audit_errors_total', stage=stage, error=type(exception).__name__)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def add_hook(self, hook):
+        self.load_hooks()
+        self.hooks.append(hook)
+
+    def load_hooks(self):
+        if self.hooks is None:
+            hooks = []
+            for dotted_path in self.hook_paths:
+                module_path, name = dotted_path.rsplit('.', 1)
+                hooks.append(getattr(import_module(module_path), name))
+            self.hooks = hooks
+
+    def call_hooks(self, kind, name, value, labels):
+        self.load_hooks()
+        for hook in self.hooks:
+            try:
+                hook(kind, name, value, labels)
+            except Exception:
+                logger.exception('Exception in audit metrics hook {}.'.format(hook))
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def prometheus_text(self):
+        """ @return: All metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            samples = [(name, 'counter', labels, value) for (name, labels), value in self.counters.items()]
+            histograms = [(name, labels, list(histogram)) for (name, labels), histogram in self.histograms.items()]
+        for collector in self.collectors:
+            try:
+                samples.extend(
+                    (name, kind, tuple(sorted(labels.items())), value) for name, kind, labels, value in collector()
+                )
+            except Exception:
+                logger.exception('Exception in audit metrics collector {}.'.format(collector))
+
+        families = {}
+        for name, kind, labels, value in samples:
+            families.setdefault((name, kind), []).append(
+                '{}{} {}'.format(name, format_labels(labels), format_value(value))
+            )
+        for name, labels, histogram in sorted(histograms, key=lambda h: (h[0], format_labels(h[1]))):
+            lines = families.setdefault((name, 'histogram'), [])
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', repr(bound)),)), count))
+            lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', '+Inf'),)), histogram[-2]))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), histogram[-2]))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(histogram[-1])))
+
+        output = []
+        for (name, kind), lines in sorted(families.items()):
+            if name in HELP:
+                output.append('# HELP {} {}'.format(name, HELP[name]))
+            output.append('# TYPE {} {}'.format(name, kind))
+            # Histogram lines are already in order, by labels then bucket.
+            output.extend(lines if kind == 'histogram' else sorted(lines))
+        return '\n'.join(output) + '\n'
+
+
+metrics = Metrics()
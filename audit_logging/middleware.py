@@ -1,14 +1,72 @@
-from audit_logging.utils import audit_logging_thread_local
+import asyncio
+import functools
+
+from audit_logging.utils import (
+    LazyUserDetails, end_actor_cache, reset_user_details, run_sync, set_user_details, start_actor_cache
+)
+from audit_logging.writers import event_buffer, event_deduplicator, flush_deduplicated_events, flush_event_buffer
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:
+    def markcoroutinefunction(func):
+        func._is_coroutine = getattr(asyncio.coroutines, '_is_coroutine', None)
+        return func
+
 
 class UserDetailsMiddleware(object):
-    """ Saves a dict with user details to thread-local storage to facilitate access in signal handlers
+    """ Saves a dict with user details to the request's context to facilitate access in signal handlers
         so user details can be logged with events.  If user details are unavailable stores None.
+        request.user is only read (loading the session & user) when the request records an event.
+        Buffered audit events (AUDIT_BUFFER_EVENTS) and deduplicated events whose window has passed
+        (AUDIT_DEDUP_WINDOW) are written and user details looked up during the request
+        (see utils.get_cached_actor_value()) discarded when the response is complete.
+        Works as both sync and async middleware, so it runs natively under ASGI without a thread-pool adapter.
         @note: Place after AuthenticationMiddleware.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        token = set_user_details(self.lazy_user_details(request))
+        cache_token = start_actor_cache()
+        try:
+            response = self.get_response(request)
+        finally:
+            if event_deduplicator.has_expired():
+                flush_deduplicated_events(expired_only=True)
+            flush_event_buffer()
+            end_actor_cache(cache_token)
+            reset_user_details(token)
+        return response
+
+    async def __acall__(self, request):
+        token = set_user_details(self.lazy_user_details(request))
+        cache_token = start_actor_cache()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if event_deduplicator.has_expired():
+                await run_sync(flush_deduplicated_events, True)
+            if len(event_buffer):
+                await run_sync(flush_event_buffer)
+            end_actor_cache(cache_token)
+            reset_user_details(token)
+        return response
+
+    def lazy_user_details(self, request):
+        return LazyUserDetails(functools.partial(self.get_user_details, request))
+
+    def get_user_details(self, request):
         try:
             user_details = {
                 'username': request.user.username,
@@ -17,8 +75,4 @@ class UserDetailsMiddleware(object):
             }
         except KeyError:
             user_details = None
-
-        audit_logging_thread_local.user_details = user_details
-
-        response = self.get_response(request)
-        return response
+        return user_details
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit_logging', '0002_auditevent_datetime_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditevent',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='auditevent',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
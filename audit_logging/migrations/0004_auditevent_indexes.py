@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# (<index name>, <columns>) of the indexes the operations below create, as created on PostgreSQL.  The names are
+#   short enough not to be truncated (Django finds the indexes by their columns when they're changed later).
+POSTGRESQL_INDEXES = [
+    ('audit_logging_auditevent_datetime_idx', ['datetime']),
+    ('audit_logging_auditevent_resource_datetime_idx', ['resource_type', 'resource_uuid', 'datetime']),
+    ('audit_logging_auditevent_username_datetime_idx', ['username', 'datetime']),
+]
+
+
+def create_indexes_concurrently(apps, schema_editor):
+    """ A plain CREATE INDEX blocks writes to the table until it's built, which on a large audit table stops every
+        audited request for the duration.  IF NOT EXISTS skips indexes created in advance with the same names.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('audit_logging', 'AuditEvent')._meta.db_table
+    for name, columns in POSTGRESQL_INDEXES:
+        schema_editor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})'.format(
+            schema_editor.quote_name(name), schema_editor.quote_name(table),
+            ', '.join(schema_editor.quote_name(column) for column in columns)
+        ))
+
+
+def drop_indexes_concurrently(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, columns in POSTGRESQL_INDEXES:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(schema_editor.quote_name(name)))
+
+
+class ExceptOnPostgreSQL(migrations.SeparateDatabaseAndState):
+    """ Changes the database like its operations except on PostgreSQL, where create_indexes_concurrently() does.
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super(ExceptOnPostgreSQL, self).database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super(ExceptOnPostgreSQL, self).database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+OPERATIONS = [
+    migrations.AlterField(
+        model_name='auditevent',
+        name='datetime',
+        field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+    ),
+    migrations.AlterIndexTogether(
+        name='auditevent',
+        index_together=set([('username', 'datetime'), ('resource_type', 'resource_uuid', 'datetime')]),
+    ),
+]
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('audit_logging', '0003_auditevent_count_size'),
+    ]
+
+    operations = [
+        ExceptOnPostgreSQL(state_operations=OPERATIONS, database_operations=OPERATIONS),
+        migrations.RunPython(create_indexes_concurrently, drop_indexes_concurrently),
+    ]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit_logging', '0004_auditevent_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditActor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('username', models.CharField(db_index=True, max_length=255, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('fullname', models.CharField(blank=True, max_length=255, null=True)),
+                ('superuser', models.NullBooleanField()),
+                ('staff', models.NullBooleanField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditEventType',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditResourceType',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CompactAuditEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('datetime', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('resource_uuid', models.CharField(blank=True, max_length=255, null=True)),
+                ('resource_title', models.CharField(blank=True, max_length=255, null=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('actor', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='audit_logging.AuditActor')),
+                ('event', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='audit_logging.AuditEventType')),
+                ('resource_type', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='audit_logging.AuditResourceType')),
+            ],
+            options={
+                'verbose_name': 'compact audit event',
+                'verbose_name_plural': 'compact audit events',
+                'ordering': ['-datetime'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='compactauditevent',
+            index_together=set([('actor', 'datetime'), ('resource_type', 'resource_uuid', 'datetime')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit_logging', '0005_compact_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditevent',
+            name='last_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='compactauditevent',
+            name='last_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
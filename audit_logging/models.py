@@ -20,6 +20,7 @@
 
 from django.db import models
 from django.forms.models import model_to_dict
+from django.utils import timezone
 
 class AuditEvent(models.Model):
     id = models.AutoField(verbose_name='ID',
@@ -33,18 +34,104 @@ class AuditEvent(models.Model):
     fullname = models.CharField(max_length=255, null=True, blank=True)
     superuser = models.NullBooleanField()
     staff = models.NullBooleanField()
-    datetime = models.DateTimeField(auto_now_add=True)
+    # Set when the event is recorded rather than when the row is inserted, which may be later for buffered events.
+    datetime = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     resource_type = models.CharField(max_length=32, null=True, blank=True)
     resource_uuid = models.CharField(max_length=255, null=True, blank=True)
     resource_title = models.CharField(max_length=255, null=True, blank=True)
+    # Number of occurrences this row records and their total size in bytes, e.g. for aggregated file reads.
+    count = models.PositiveIntegerField(default=1)
+    size = models.BigIntegerField(null=True, blank=True)
+    # Time of the last occurrence (datetime being the first) for repeats collapsed into this row by AUDIT_DEDUP_WINDOW.
+    last_datetime = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'audit event'
         verbose_name_plural = 'audit events'
         ordering = ['-datetime']
+        # History of a resource & activity of a user, both newest first.
+        index_together = [
+            ('resource_type', 'resource_uuid', 'datetime'),
+            ('username', 'datetime'),
+        ]
 
     def __str__(self):
         d = model_to_dict(self)
         repr = ', '.join(['{}: {}'.format(field_name, field_value) for field_name, field_value in d.items()])
         repr = 'AuditEvent({})'.format(repr)
         return repr
+
+
+class AuditEventType(models.Model):
+    """ Event names referenced by CompactAuditEvent.
+    """
+    name = models.CharField(max_length=16, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class AuditResourceType(models.Model):
+    """ Resource types referenced by CompactAuditEvent.
+    """
+    name = models.CharField(max_length=32, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class AuditActor(models.Model):
+    """ A distinct combination of the user details recorded with events, referenced by CompactAuditEvent.
+        key is a hash of the other fields (see compact.actor_key()) so actors with null details are deduplicated too.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    username = models.CharField(max_length=255, null=True, blank=False, db_index=True)
+    email = models.EmailField(null=True, blank=True)
+    fullname = models.CharField(max_length=255, null=True, blank=True)
+    superuser = models.NullBooleanField()
+    staff = models.NullBooleanField()
+
+    def __str__(self):
+        return '{}'.format(self.username)
+
+
+class CompactAuditEvent(models.Model):
+    """ AuditEvent with event, resource type & user details stored as references to lookup tables, written instead of
+        AuditEvent when AUDIT_STORAGE is 'compact'.  to_audit_event() reconstructs the readable form.
+    """
+    event = models.ForeignKey(AuditEventType, on_delete=models.PROTECT, null=True, db_index=False)
+    actor = models.ForeignKey(AuditActor, on_delete=models.PROTECT, null=True, db_index=False)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    datetime = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+    resource_type = models.ForeignKey(AuditResourceType, on_delete=models.PROTECT, null=True, db_index=False)
+    resource_uuid = models.CharField(max_length=255, null=True, blank=True)
+    resource_title = models.CharField(max_length=255, null=True, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    size = models.BigIntegerField(null=True, blank=True)
+    last_datetime = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = 'compact audit event'
+        verbose_name_plural = 'compact audit events'
+        ordering = ['-datetime']
+        # The lookup foreign keys aren't indexed on their own; these cover resource & actor lookups.
+        index_together = [
+            ('resource_type', 'resource_uuid', 'datetime'),
+            ('actor', 'datetime'),
+        ]
+
+    def to_audit_event(self):
+        """ @return: An unsaved AuditEvent with this event's values; select_related('event', 'actor', 'resource_type')
+                when reading many events.
+        """
+        actor = self.actor or AuditActor()
+        return AuditEvent(
+            id=self.id, event=self.event and self.event.name, username=actor.username, ip=self.ip, email=actor.email,
+            fullname=actor.fullname, superuser=actor.superuser, staff=actor.staff, datetime=self.datetime,
+            resource_type=self.resource_type and self.resource_type.name, resource_uuid=self.resource_uuid,
+            resource_title=self.resource_title, count=self.count, size=self.size,
+            last_datetime=self.last_datetime
+        )
+
+    def __str__(self):
+        return str(self.to_audit_event()).replace('AuditEvent(', 'CompactAuditEvent(', 1)
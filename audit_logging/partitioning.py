@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Time-partitioned AuditEvent storage so expired events can be removed by dropping a table instead of DELETEing rows.
+    The table partitioned is the one events are written to: AuditEvent's or, with AUDIT_STORAGE = 'compact',
+    CompactAuditEvent's.
+
+    PostgreSQL (11+): the event table is converted once into a table partitioned by range on datetime
+        (PostgresPartitions.setup()); partitions are then created ahead of time and dropped when expired.
+    Other databases: the event table is periodically swapped for an empty one and the old table is kept as a
+        rolling table (RollingTables.rotate()).  Rolling tables aren't visible through the event models.
+
+    Partitions and rolling tables are named '<event table>_p<first day>_<day after last>', e.g.
+        audit_logging_auditevent_p20171001_20171101, so their time range is known without querying them.  A rolling
+        table for the same range as an earlier one (when rows dated before the last rollover were inserted since)
+        gets a '_<n>' suffix, e.g. audit_logging_auditevent_p20171001_20171101_2.
+"""
+from datetime import datetime, timedelta
+from logging import getLogger
+import re
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from audit_logging.compact import stored_events
+
+
+logger = getLogger(__name__)
+
+PERIODS = ('monthly', 'daily')
+NAME_DATE_FORMAT = '%Y%m%d'
+# Start of the PostgreSQL partition holding the rows that were in the table before partitioning
+LEGACY_START = datetime(1, 1, 1, tzinfo=timezone.utc)
+
+
+def period_start(dt, period):
+    """ @return: Start of the period containing dt.
+    """
+    dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'monthly':
+        dt = dt.replace(day=1)
+    return dt
+
+
+def add_periods(start, period, count):
+    """ @return: Start of the period count periods after (or before, if count is negative) the one starting at start.
+    """
+    if period == 'daily':
+        return start + timedelta(days=count)
+    month_index = start.year * 12 + start.month - 1 + count
+    return start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def retention_cutoff(now, period, retain):
+    """ @return: Time before which events are expired when keeping the current period and retain previous periods.
+    """
+    return add_periods(period_start(now, period), period, -retain)
+
+
+def get_partitioner(connection, period, storage=None):
+    """ @param storage: One of compact.STORAGES, default AUDIT_STORAGE.
+    """
+    if connection.vendor == 'postgresql':
+        return PostgresPartitions(connection, period, storage)
+    return RollingTables(connection, period, storage)
+
+
+class Partitions(object):
+    """ Common naming & retention handling for PostgresPartitions and RollingTables.
+    """
+    def __init__(self, connection, period, storage=None):
+        if period not in PERIODS:
+            raise ValueError('Unknown audit partition period {}, expected one of {}'.format(period, PERIODS))
+        self.model = stored_events(storage).model
+        self.connection = connection
+        self.period = period
+        self.table = self.model._meta.db_table
+        self.name_pattern = re.compile(r'^{}_p(\d{{8}})_(\d{{8}})(?:_\d+)?$'.format(re.escape(self.table)))
+
+    def partition_name(self, start, end):
+        # Not strftime(), which doesn't zero-pad years before 1000 on all platforms.
+        return '{}_p{:04d}{:02d}{:02d}_{:04d}{:02d}{:02d}'.format(
+            self.table, start.year, start.month, start.day, end.year, end.month, end.day
+        )
+
+    def partitions(self):
+        """ @return: [(<table name>, <start>, <end>), ...] oldest first.
+        """
+        res = []
+        with self.connection.cursor() as cursor:
+            table_names = self.connection.introspection.table_names(cursor)
+        for name in table_names:
+            match = self.name_pattern.match(name)
+            if match:
+                start, end = [
+                    timezone.make_aware(datetime.strptime(date, NAME_DATE_FORMAT), timezone.utc)
+                    for date in match.groups()[:2]
+                ]
+                res.append((name, start, end))
+        return sorted(res, key=lambda partition: partition[1])
+
+    def expired(self, cutoff):
+        return [name for name, start, end in self.partitions() if end <= cutoff]
+
+    def drop(self, name):
+        logger.info('Dropping expired audit event table {}'.format(name))
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE {}'.format(self.connection.ops.quote_name(name)))
+
+    def execute(self, *statements):
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+class PostgresPartitions(Partitions):
+
+    def is_set_up(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [self.table])
+            row = cursor.fetchone()
+        return row is not None and row[0] == 'p'
+
+    def setup(self, now):
+        """ Converts the event table to a partitioned table.  Existing rows stay where they are, attached as the
+            partition for everything before the end of the period after the current one (leaving at least a period
+            for the steps before the switch, during which newer rows couldn't be inserted).
+            The slow steps run first without blocking writes: a NOT VALID check constraint matching the partition
+            bound is validated and the unique (id, datetime) index the partitioned primary key needs is built
+            concurrently.  ATTACH PARTITION then uses both instead of scanning the table & building the index while
+            holding its ACCESS EXCLUSIVE lock.  Must not be called inside a transaction (CREATE INDEX CONCURRENTLY).
+        """
+        qn = self.connection.ops.quote_name
+        boundary = add_periods(period_start(now, self.period), self.period, 2)
+        legacy = self.partition_name(LEGACY_START, boundary)
+        check = self.table + '_legacy_bound'
+        self.execute(
+            'ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}'.format(qn(self.table), qn(check)),
+            # NOT VALID only takes the lock briefly; VALIDATE scans the table without blocking writes.
+            "ALTER TABLE {} ADD CONSTRAINT {} CHECK (datetime IS NOT NULL AND datetime < '{}') NOT VALID".format(
+                qn(self.table), qn(check), boundary.isoformat()
+            ),
+            'ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(qn(self.table), qn(check)),
+            # Attached to the partitioned table's primary key by ATTACH PARTITION; the other indexes of the
+            #   partitioned table match the ones the table already has (migrations 0004 & 0005).
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (id, datetime)'.format(
+                qn(self.table + '_id_datetime'), qn(self.table)
+            ),
+        )
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [self.table, 'id'])
+                sequence = cursor.fetchone()[0]
+            self.execute(
+                'ALTER TABLE {} RENAME TO {}'.format(qn(self.table), qn(legacy)),
+                'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (datetime)'.format(
+                    qn(self.table), qn(legacy)
+                ),
+                # Primary keys of partitioned tables must include the partition key.
+                'ALTER TABLE {} ADD PRIMARY KEY (id, datetime)'.format(qn(self.table)),
+                # Keep the id sequence when the legacy partition is dropped.
+                'ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, qn(self.table)),
+            )
+            self.execute(*self.index_statements())
+            self.execute(
+                # The validated check constraint implies the partition bound, so the table isn't scanned.
+                "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO ('{}')".format(
+                    qn(self.table), qn(legacy), boundary.isoformat()
+                ),
+                'ALTER TABLE {} DROP CONSTRAINT {}'.format(qn(legacy), qn(check)),
+                # Catches events outside any partition (e.g. if the command hasn't run for a while).
+                'CREATE TABLE {} PARTITION OF {} DEFAULT'.format(qn(self.table + '_default'), qn(self.table)),
+            )
+
+    def index_statements(self):
+        """ @return: CREATE INDEX statements for the partitioned table matching the model's datetime & index_together
+                indexes.
+        """
+        qn = self.connection.ops.quote_name
+        indexes = [['datetime']] + [
+            [self.model._meta.get_field(name).column for name in fields] for fields in self.model._meta.index_together
+        ]
+        return [
+            'CREATE INDEX {} ON {} ({})'.format(
+                qn('{}_{}_part'.format(self.table, columns[0])), qn(self.table), ', '.join(qn(c) for c in columns)
+            )
+            for columns in indexes
+        ]
+
+    def create_ahead(self, now, ahead, dry_run=False):
+        """ Creates partitions for the current period and ahead following periods if they don't exist.
+            @param dry_run: Only return the names, without creating the partitions.
+            @return: Names of the partitions created.
+        """
+        qn = self.connection.ops.quote_name
+        existing = self.partitions()
+        created = []
+        start = period_start(now, self.period)
+        for i in range(ahead + 1):
+            end = add_periods(start, self.period, 1)
+            if not any(p_start < end and start < p_end for name, p_start, p_end in existing):
+                name = self.partition_name(start, end)
+                if not dry_run:
+                    logger.info('Creating audit event partition {}'.format(name))
+                    self.execute("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ('{}') TO ('{}')".format(
+                        qn(name), qn(self.table), start.isoformat(), end.isoformat()
+                    ))
+                created.append(name)
+            start = end
+        return created
+
+
+class RollingTables(Partitions):
+
+    def rotation_due(self, now):
+        return self.model.objects.filter(datetime__lt=period_start(now, self.period)).exists()
+
+    def rolled_name(self, now):
+        """ @return: Name for the rolling table the event table would be renamed to by rotate(now).
+        """
+        qn = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT MIN(datetime) FROM {}'.format(qn(self.table)))
+            first_datetime = cursor.fetchone()[0]
+        if first_datetime is None:
+            first_datetime = now
+        elif isinstance(first_datetime, str):
+            first_datetime = parse_datetime(first_datetime)
+        if timezone.is_naive(first_datetime):
+            first_datetime = timezone.make_aware(first_datetime, timezone.utc)
+        start = period_start(first_datetime, self.period)
+        end = add_periods(period_start(now, self.period), self.period, 1)
+        name = self.partition_name(start, end)
+        existing = set(p_name for p_name, p_start, p_end in self.partitions())
+        rolled, suffix = name, 2
+        while rolled in existing:
+            rolled = '{}_{}'.format(name, suffix)
+            suffix += 1
+        return rolled
+
+    def rotate(self, now):
+        """ Renames the event table to a rolling table and replaces it with an empty one, continuing its ids.
+            @return: Name of the rolling table.
+        """
+        qn = self.connection.ops.quote_name
+        rolled = self.rolled_name(now)
+        logger.info('Rolling audit event table over to {}'.format(rolled))
+
+        if self.connection.vendor == 'mysql':
+            self.rotate_mysql(rolled)
+            return rolled
+
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                # Inside the transaction, so no row can be inserted between reading the last id and the rename.
+                cursor.execute('SELECT MAX(id) FROM {}'.format(qn(self.table)))
+                max_id = cursor.fetchone()[0]
+                cursor.execute('PRAGMA index_list({})'.format(qn(self.table)))
+                index_names = [row[1] for row in cursor.fetchall() if not row[1].startswith('sqlite_autoindex')]
+            self.execute('ALTER TABLE {} RENAME TO {}'.format(qn(self.table), qn(rolled)))
+            # SQLite index names are database-wide, so the rolled table's indexes must go before they're recreated.
+            self.execute(*['DROP INDEX {}'.format(qn(name)) for name in index_names])
+            with self.connection.schema_editor() as schema_editor:
+                schema_editor.create_model(self.model)
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [self.table, int(max_id or 0)]
+                )
+        return rolled
+
+    def rotate_mysql(self, rolled):
+        """ MySQL DDL commits implicitly, so rather than a transaction both tables are write-locked while the last id
+            is read and the tables are swapped, so no row is inserted in between (RENAME TABLE of locked tables needs
+            MySQL 8.0.13+).
+        """
+        qn = self.connection.ops.quote_name
+        replacement = self.table + '_new'
+        self.execute('CREATE TABLE {} LIKE {}'.format(qn(replacement), qn(self.table)))
+        self.execute('LOCK TABLES {} WRITE, {} WRITE'.format(qn(self.table), qn(replacement)))
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT MAX(id) FROM {}'.format(qn(self.table)))
+                max_id = cursor.fetchone()[0]
+            self.execute(
+                'ALTER TABLE {} AUTO_INCREMENT = {}'.format(qn(replacement), int(max_id or 0) + 1),
+                # Swaps both tables in one atomic operation.
+                'RENAME TABLE {} TO {}, {} TO {}'.format(qn(self.table), qn(rolled), qn(replacement), qn(self.table)),
+            )
+        finally:
+            self.execute('UNLOCK TABLES')
@@ -20,13 +20,16 @@
 
 import logging
 
+from django.apps import apps
 from django.contrib.auth import signals as auth_signals, get_user_model
 from django.db.models import signals as models_signals
 from .models import AuditEvent
 from audit_logging.audit_settings import AUDIT_TO_FILE
 from audit_logging import version as audit_logging_version
+from audit_logging.metrics import metrics
 from audit_logging.utils import (
-    get_audit_crud_dict, get_audit_login_dict, get_time_gmt, write_entry, audit_logging_thread_local
+    build_event_record, configure_audit_models, get_audit_crud_dict, get_audit_login_dict, get_time_gmt,
+    get_user_details, is_event_audited, save_event, write_entry
 )
 
 
@@ -38,6 +41,11 @@ def log_event(instance, event=None):
     if isinstance(instance, AuditEvent):
         return
 
+    with metrics.timer('audit_event_seconds', event=event):
+        record_crud_event(instance, event)
+
+
+def record_crud_event(instance, event):
     try:
         d = get_audit_crud_dict(instance, event)
         if d:
@@ -70,17 +78,19 @@ def log_event(instance, event=None):
 #                 if d.get('resource').get('username'):
 #                     audit_event.username = d['resource']['username']
 #             audit_event.save()
-            from audit_logging.utils import log_event
-            user_details = getattr(audit_logging_thread_local, 'user_details', {})
-            logger.debug('Got user_details from audit_logging_thread_local: {} ')
+            user_details = get_user_details()
+            logger.debug('Got user_details from request/task context: {}'.format(user_details))
             resource = d.get('resource')
             resource_type = resource.get('type', 'unknown') if resource else 'unknown'
             resource_uuid = resource.get('id', 'unknown') if resource else 'unknown'
-            log_event(event=event, resource_type=resource_type, resource_uuid=resource_uuid, user_details=user_details)
+            save_event(build_event_record(
+                event=event, resource_type=resource_type, resource_uuid=resource_uuid, user_details=user_details
+            ))
         else:
             logger.debug('get_audit_crud_dict() returned nothing (normal if {} not in AUDIT_MODELS)'.format(instance))
     except Exception as ex:
         logger.exception('Exception during audit event.')
+        metrics.count_error('model_signal', ex)
 
 
 def post_save(sender, instance, created, raw, using, update_fields, **kwargs):
@@ -96,6 +106,8 @@ def post_save(sender, instance, created, raw, using, update_fields, **kwargs):
         event = 'create'
     else:
         event = 'update'
+    if not is_event_audited(type(instance), event, update_fields):
+        return
     log_event(instance, event)
 
 
@@ -107,6 +119,8 @@ def post_delete(sender, instance, using, **kwargs):
         return
     logger.debug('Received post_delete signal for: {} ({})'.format(instance, type(instance)))
 
+    if not is_event_audited(type(instance), 'delete'):
+        return
     log_event(instance, 'delete')
 
 
@@ -114,81 +128,80 @@ def user_logged_in(sender, request, user, **kwargs):
     """
     signal to catch logins and log them in the audit log
     """
-    try:
-        event = 'login'
-        d = get_audit_login_dict(request, user, event)
-        if d:
-            if AUDIT_TO_FILE:
-                write_entry(d)
-            login_event = AuditEvent(
-                event=event,
-                username=d['user_details']['username'],
-                ip=d['user_details']['ip'],
-                email=d['user_details']['email'],
-                fullname=d['user_details']['fullname'],
-                superuser=d['user_details']['superuser'],
-                staff=d['user_details']['staff'],
-            )
-            login_event.save()
-    except:
-        pass
+    event = 'login'
+    with metrics.timer('audit_event_seconds', event=event):
+        try:
+            d = get_audit_login_dict(request, user, event)
+            if d:
+                if AUDIT_TO_FILE:
+                    write_entry(d)
+                save_event(build_event_record(event=event, user_details=d['user_details']))
+        except Exception as ex:
+            logger.exception('Exception during {} audit event.'.format(event))
+            metrics.count_error('login_signal', ex)
 
 
 def user_logged_out(sender, request, user, **kwargs):
     """
     signal to catch user log outs and log them in the audit log
     """
-    try:
-        event = 'logout'
-        d = get_audit_login_dict(request, user, event)
-        if d:
-            if AUDIT_TO_FILE:
-                write_entry(d)
-            login_event = AuditEvent(
-                event=event,
-                username=d['user_details']['username'],
-                ip=d['user_details']['ip'],
-                email=d['user_details']['email'],
-                fullname=d['user_details']['fullname'],
-                superuser=d['user_details']['superuser'],
-                staff=d['user_details']['staff'],
-            )
-            login_event.save()
-    except:
-        pass
+    event = 'logout'
+    with metrics.timer('audit_event_seconds', event=event):
+        try:
+            d = get_audit_login_dict(request, user, event)
+            if d:
+                if AUDIT_TO_FILE:
+                    write_entry(d)
+                save_event(build_event_record(event=event, user_details=d['user_details']))
+        except Exception as ex:
+            logger.exception('Exception during {} audit event.'.format(event))
+            metrics.count_error('logout_signal', ex)
 
 
 def user_login_failed(sender, credentials, **kwargs):
     """
     signal to catch failed logins and log them in the audit log
     """
-    try:
-        event = 'failed_login'
-        user_model = get_user_model()
-        d = {
-            "event_time_gmt": get_time_gmt(),
-            "event": event,
-            "username": credentials[user_model.USERNAME_FIELD],
-        }
-        if AUDIT_TO_FILE:
-            write_entry(d)
-        login_event = AuditEvent(
-            event=event,
-            username=d['username'],
-        )
-        login_event.save()
-    except:
-        pass
-
-
-models_signals.post_save.connect(
-    post_save,
-    dispatch_uid='easy_audit_signals_post_save'
-)
-models_signals.post_delete.connect(
-    post_delete,
-    dispatch_uid='easy_audit_signals_post_delete'
-)
+    event = 'failed_login'
+    with metrics.timer('audit_event_seconds', event=event):
+        try:
+            user_model = get_user_model()
+            d = {
+                "event_time_gmt": get_time_gmt(),
+                "event": event,
+                "username": credentials[user_model.USERNAME_FIELD],
+            }
+            if AUDIT_TO_FILE:
+                write_entry(d)
+            save_event(build_event_record(event=event, user_details={'username': d['username']}))
+        except Exception as ex:
+            logger.exception('Exception during {} audit event.'.format(event))
+            metrics.count_error('failed_login_signal', ex)
+
+
+def connect_model_signals():
+    """ Connects post_save & post_delete only for the models in AUDIT_MODELS and their subclasses so saves of other
+        models aren't dispatched to these handlers at all.  Called from AuditConfig.ready() once all models are loaded.
+    """
+    audited_models = tuple(configure_audit_models().values())
+    if not audited_models:
+        return
+
+    for model in apps.get_models():
+        if issubclass(model, audited_models):
+            logger.debug('Connecting audit signal handlers for {}'.format(model))
+            models_signals.post_save.connect(
+                post_save,
+                sender=model,
+                dispatch_uid='easy_audit_signals_post_save'
+            )
+            models_signals.post_delete.connect(
+                post_delete,
+                sender=model,
+                dispatch_uid='easy_audit_signals_post_delete'
+            )
+
+
 auth_signals.user_logged_in.connect(
     user_logged_in,
     dispatch_uid='audit_signals_logged_out'
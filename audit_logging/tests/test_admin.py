@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from mock import patch
+from audit_logging.admin import AuditEventAdmin, CompactAuditEventAdmin, EstimatedCountPaginator
+from audit_logging.compact import clear_caches, compact_event
+from audit_logging.models import AuditEvent, CompactAuditEvent
+from audit_logging.utils import build_event_record
+
+
+@patch('audit_logging.admin.AUDIT_ADMIN_LARGE_TABLE', True)
+class LargeTableAdminTests(TestCase):
+
+    def setUp(self):
+        start = datetime(2018, 2, 1, tzinfo=timezone.utc)
+        for i in range(5):
+            AuditEvent.objects.create(
+                event='create', username='user{}'.format(i), resource_type='layer', resource_uuid=str(i),
+                datetime=start - timedelta(days=40 * i)
+            )
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def changelist(self, params=None, model=AuditEvent, model_admin_class=AuditEventAdmin, **attributes):
+        model_admin = model_admin_class(model, admin.site)
+        for name, value in attributes.items():
+            setattr(model_admin, name, value)
+        request = RequestFactory().get('/admin/audit_logging/auditevent/', params or {})
+        request.user = self.user
+        response = model_admin.changelist_view(request)
+        response.render()
+        return response
+
+    @patch('audit_logging.admin.AUDIT_ADMIN_COUNT_LIMIT', 3)
+    def test_count_limited(self):
+        self.assertEqual(EstimatedCountPaginator(AuditEvent.objects.filter(event='create'), 2).count, 3)
+
+    def test_keyset_pages(self):
+        response = self.changelist(list_per_page=2)
+        cl = response.context_data['cl']
+        self.assertEqual([audit_event.resource_uuid for audit_event in cl.result_list], ['0', '1'])
+
+        cl = self.changelist(QueryDict(cl.older_url.lstrip('?')).dict(), list_per_page=2).context_data['cl']
+        self.assertEqual([audit_event.resource_uuid for audit_event in cl.result_list], ['2', '3'])
+
+    def test_prefix_search(self):
+        AuditEvent.objects.create(event='create', username='other')
+        cl = self.changelist({'q': 'user'}).context_data['cl']
+        self.assertEqual(len(cl.result_list), 5)
+        cl = self.changelist({'q': '3', 'resource_type': 'layer'}).context_data['cl']
+        self.assertEqual([audit_event.resource_uuid for audit_event in cl.result_list], ['3'])
+
+    def test_date_hierarchy_from_range(self):
+        response = self.changelist()
+        self.assertContains(response, '>2017</a>')
+        self.assertContains(response, '>2018</a>')
+        # Offered although there are no events in September.
+        self.assertContains(self.changelist({'datetime__year': '2017'}), 'September 2017')
+
+    def test_compact_events(self):
+        clear_caches()
+        for i in range(3):
+            compact_event(build_event_record(
+                event='update', resource_type='layer', resource_uuid=str(i),
+                user_details={'username': 'user{}'.format(i), 'staff': True}
+            )).save()
+        compact_event(build_event_record(event='update', user_details={'username': 'other'})).save()
+        response = self.changelist(
+            {'q': 'user', 'resource_type': 'layer'}, model=CompactAuditEvent, model_admin_class=CompactAuditEventAdmin
+        )
+        self.assertEqual(sorted(audit_event.resource_uuid for audit_event in response.context_data['cl'].result_list),
+                         ['0', '1', '2'])
+        self.assertContains(response, 'user1')
+
+
+class CompactAuditEventAdminTests(TestCase):
+
+    def test_search(self):
+        clear_caches()
+        for username in ('alice', 'bob'):
+            compact_event(build_event_record(event='login', user_details={'username': username})).save()
+        request = RequestFactory().get('/admin/audit_logging/compactauditevent/', {'q': 'alice'})
+        request.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        response = CompactAuditEventAdmin(CompactAuditEvent, admin.site).changelist_view(request)
+        response.render()
+        self.assertEqual([audit_event.actor.username for audit_event in response.context_data['cl'].result_list],
+                         ['alice'])
+        self.assertContains(response, 'login')
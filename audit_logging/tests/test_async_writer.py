@@ -0,0 +1,48 @@
+from tempfile import NamedTemporaryFile
+import os
+from django.test import TestCase
+from mock import patch
+from audit_logging.async_writer import AsyncEventWriter, replay_spilled_events
+from audit_logging.models import AuditEvent
+from audit_logging.utils import build_event_record
+
+
+class AsyncEventWriterTests(TestCase):
+
+    @patch('audit_logging.async_writer.write_events')
+    def test_records_written_by_thread(self, write_events):
+        writer = AsyncEventWriter(max_size=10, batch_size=5)
+        for i in range(7):
+            writer.put(build_event_record(event='create', resource_uuid=i))
+        writer.stop()
+
+        written = [record for call in write_events.call_args_list for record in call[0][0]]
+        self.assertEqual([record['resource_uuid'] for record in written], list(range(7)))
+        self.assertEqual(writer.counters['queued'], 7)
+        self.assertEqual(writer.counters['written'], 7)
+
+    def test_drop_oldest(self):
+        writer = AsyncEventWriter(max_size=2, overflow='drop_oldest')
+        with patch.object(writer, 'start'):
+            for i in range(3):
+                writer.put(build_event_record(event='create', resource_uuid=i))
+
+        self.assertEqual(writer.counters['dropped'], 1)
+        self.assertEqual([writer.queue.get_nowait()['resource_uuid'] for i in range(2)], [1, 2])
+
+    def test_spill_and_replay(self):
+        with NamedTemporaryFile() as f:
+            spill_location = f.name
+        writer = AsyncEventWriter(max_size=1, overflow='spill', spill_location=spill_location)
+        with patch.object(writer, 'start'):
+            writer.put(build_event_record(event='create', resource_uuid='queued'))
+            writer.put(build_event_record(event='create', resource_uuid='spilled'))
+        self.assertEqual(writer.counters['spilled'], 1)
+
+        self.assertEqual(replay_spilled_events(spill_location), 1)
+        self.assertFalse(os.path.exists(spill_location))
+        self.assertTrue(AuditEvent.objects.filter(resource_uuid='spilled').exists())
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            AsyncEventWriter(overflow='bogus')
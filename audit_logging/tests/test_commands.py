@@ -0,0 +1,197 @@
+from datetime import timedelta
+from tempfile import mkdtemp
+import gzip
+import json
+import os
+import shutil
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import patch
+from audit_logging.compact import clear_caches, compact_event
+from audit_logging.models import AuditEvent, CompactAuditEvent
+from audit_logging.utils import build_event_record
+
+
+def create_compact_event(datetime=None, **kwargs):
+    record = build_event_record(**kwargs)
+    if datetime is not None:
+        record['datetime'] = datetime
+    return compact_event(record).save()
+
+
+class AuditArchiveTests(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.output = os.path.join(self.directory, 'archive.json.gz')
+        old = timezone.now() - timedelta(days=30)
+        for i in range(5):
+            AuditEvent.objects.create(event='create', resource_uuid='old{}'.format(i), datetime=old)
+        AuditEvent.objects.create(event='create', resource_uuid='new')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_archive(self):
+        with gzip.open(self.output, 'rt') as f:
+            return [json.loads(line) for line in f]
+
+    def test_archive(self):
+        call_command('audit_archive', older_than_days=7, output=self.output, chunk_size=2, stdout=StringIO())
+
+        self.assertEqual([d['resource']['id'] for d in self.read_archive()], ['old{}'.format(i) for i in range(5)])
+        self.assertEqual(list(AuditEvent.objects.values_list('resource_uuid', flat=True)), ['new'])
+        self.assertFalse(os.path.exists(self.output + '.checkpoint'))
+
+    def test_keep(self):
+        call_command('audit_archive', older_than_days=7, output=self.output, keep=True, stdout=StringIO())
+        self.assertEqual(len(self.read_archive()), 5)
+        self.assertEqual(AuditEvent.objects.count(), 6)
+
+    def test_resume(self):
+        with patch('audit_logging.management.commands.audit_archive.time.sleep', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command(
+                    'audit_archive', older_than_days=7, output=self.output, chunk_size=2, sleep=1, stdout=StringIO()
+                )
+        self.assertTrue(os.path.exists(self.output + '.checkpoint'))
+
+        call_command('audit_archive', older_than_days=7, output=self.output, chunk_size=2, stdout=StringIO())
+        self.assertEqual(len(self.read_archive()), 5)
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+    def test_resume_after_unrecorded_chunk(self):
+        from audit_logging.management.commands.audit_archive import Command
+        write_checkpoint = Command.write_checkpoint
+        calls = []
+
+        def interrupt_second_chunk(command, *args):
+            calls.append(args)
+            if len(calls) == 3:
+                # The second chunk is in the archive but the checkpoint still points after the first.
+                raise KeyboardInterrupt()
+            write_checkpoint(command, *args)
+
+        with patch.object(Command, 'write_checkpoint', interrupt_second_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('audit_archive', older_than_days=7, output=self.output, chunk_size=2, stdout=StringIO())
+        self.assertEqual(len(self.read_archive()), 4)
+
+        call_command('audit_archive', older_than_days=7, output=self.output, chunk_size=2, stdout=StringIO())
+        self.assertEqual([d['resource']['id'] for d in self.read_archive()], ['old{}'.format(i) for i in range(5)])
+
+    def test_default_output_resumed(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            with patch('audit_logging.management.commands.audit_archive.time.sleep', side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command('audit_archive', older_than_days=7, chunk_size=2, sleep=1, stdout=StringIO())
+            call_command('audit_archive', older_than_days=7, chunk_size=2, stdout=StringIO())
+            archives = [name for name in os.listdir(self.directory) if name.startswith('audit_archive_')]
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(len(archives), 1)
+        self.output = os.path.join(self.directory, archives[0])
+        self.assertEqual(len(self.read_archive()), 5)
+
+    @patch('audit_logging.management.commands.audit_archive.AUDIT_STORAGE', 'compact')
+    def test_compact_storage(self):
+        clear_caches()
+        user_details = {'username': 'alice'}
+        create_compact_event(
+            event='create', resource_uuid='compact', user_details=user_details,
+            datetime=timezone.now() - timedelta(days=30)
+        )
+        create_compact_event(event='create', resource_uuid='compact new', user_details=user_details)
+        call_command('audit_archive', older_than_days=7, output=self.output, stdout=StringIO())
+
+        archived = self.read_archive()
+        self.assertEqual(
+            [(d['resource']['id'], d['user_details']['username']) for d in archived], [('compact', 'alice')]
+        )
+        self.assertEqual(list(CompactAuditEvent.objects.values_list('resource_uuid', flat=True)), ['compact new'])
+        self.assertEqual(AuditEvent.objects.count(), 6)
+
+        call_command('audit_archive', older_than_days=7, output=self.output, storage='default', stdout=StringIO())
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+
+class AuditExportTests(TestCase):
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=30)
+        AuditEvent.objects.create(event='create', username='alice', resource_uuid='old', datetime=old)
+        AuditEvent.objects.create(event='delete', username='bob', resource_uuid='new1', size=12)
+        AuditEvent.objects.create(event='create', username='alice', resource_uuid='new2')
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('audit_export', stdout=out, chunk_size=1, **options)
+        return out.getvalue()
+
+    def test_csv(self):
+        lines = self.export().splitlines()
+        self.assertTrue(lines[0].startswith('id,datetime,event,username'))
+        self.assertEqual(len(lines), 4)
+
+    def test_jsonl_filters(self):
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        records = [json.loads(line) for line in self.export(format='jsonl', since=since, username='alice').splitlines()]
+        self.assertEqual([record['resource']['id'] for record in records], ['new2'])
+
+    @patch('audit_logging.compact.AUDIT_STORAGE', 'compact')
+    def test_compact_storage(self):
+        clear_caches()
+        create_compact_event(event='create', resource_type='layer', user_details={'username': 'carol'}, size=5)
+        create_compact_event(event='create', user_details={'username': 'dave'})
+        lines = self.export(username='carol').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',create,carol,', lines[1])
+        self.assertIn(',layer,', lines[1])
+
+        records = [json.loads(line) for line in self.export(format='jsonl', event='create').splitlines()]
+        self.assertEqual(sorted(record['user_details']['username'] for record in records), ['carol', 'dave'])
+        self.assertEqual(len(self.export(storage='default').splitlines()), 4)
+
+    def test_bad_since(self):
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            self.export(since='yesterday')
+
+
+class ExportViewTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('export', password='export')
+        AuditEvent.objects.create(event='create', username='alice')
+        AuditEvent.objects.create(event='delete', username='bob')
+
+    def test_staff_only(self):
+        self.client.login(username='export', password='export')
+        response = self.client.get('/audit/export/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_streams_jsonl(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='export', password='export')
+        response = self.client.get('/audit/export/', {'format': 'jsonl', 'event': 'delete'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['user_details']['username'] for record in records], ['bob'])
+
+    @patch('audit_logging.compact.AUDIT_STORAGE', 'compact')
+    def test_compact_storage(self):
+        clear_caches()
+        create_compact_event(event='delete', user_details={'username': 'carol'})
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='export', password='export')
+        response = self.client.get('/audit/export/', {'format': 'jsonl', 'event': 'delete'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['user_details']['username'] for record in records], ['carol'])
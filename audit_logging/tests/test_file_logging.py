@@ -1,4 +1,6 @@
 # Perform audit_logging_tests for auditing.
+import gc
+from pathlib import Path
 from tempfile import NamedTemporaryFile
 from django.test import TestCase
 import os
@@ -8,21 +10,47 @@ from mock import patch
 
 class LoggingOpenTests(TestCase):
 
-    @patch('audit_logging.file_logging.AuditEvent')
-    def test_open_existing(self, AuditEvent):
+    @patch('audit_logging.file_logging.log_event')
+    def test_open_existing(self, log_event):
         with NamedTemporaryFile() as f:
             f2 = logging_open(f.name)
             self.assertIsInstance(f2, LoggingFile)
             f2.close()
-            self.assertEqual(AuditEvent.objects.create.call_count, 0)
+            f2 = logging_open(f.name, 'w')
+            f2.close()
+            self.assertEqual(log_event.call_count, 0)
 
-    @patch('audit_logging.file_logging.AuditEvent')
-    def test_open_nonexisting(self, AuditEvent):
+    @patch('audit_logging.file_logging.log_event')
+    def test_open_nonexisting(self, log_event):
         with NamedTemporaryFile() as f:
             fname = f.name
         self.assertFalse(os.path.exists(fname))
         with logging_open(fname, 'w') as f:
-            self.assertEqual(AuditEvent.objects.create.call_count, 1)
+            self.assertEqual(log_event.call_count, 1)
+            self.assertEqual(log_event.call_args[1]['event'], 'FileCreate')
+        os.remove(fname)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_open_append(self, log_event):
+        with NamedTemporaryFile() as f:
+            fname = f.name
+        with logging_open(fname, 'a') as f:
+            f.write('sample')
+        with logging_open(fname, 'a') as f:
+            f.write('sample')
+        with open(fname) as f:
+            self.assertEqual(f.read(), 'samplesample')
+        os.remove(fname)
+        self.assertEqual([call[1]['event'] for call in log_event.call_args_list].count('FileCreate'), 1)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_open_path_binary(self, log_event):
+        with NamedTemporaryFile() as f:
+            fname = f.name
+        with logging_open(filepath=Path(fname), mode='xb', buffering=0) as f:
+            f.write(b'sample')
+        os.remove(fname)
+        self.assertEqual(log_event.call_args_list[0][1]['resource_uuid'], fname)
 
 
 class LoggingFileTests(TestCase):
@@ -37,13 +65,13 @@ class LoggingFileTests(TestCase):
         ('readlines', None)
     ]
 
-    @patch('audit_logging.file_logging.AuditEvent')
-    def test_log_on_method_call(self, AuditEvent):
-        with NamedTemporaryFile() as tf:
-            lf = LoggingFile(tf, user_details={'username': 'test_log_on_method_call'})
+    @patch('audit_logging.file_logging.log_event')
+    def test_log_on_method_call(self, log_event):
+        with NamedTemporaryFile('w+') as tf:
+            lf = LoggingFile(tf, user_details={'username': 'test_log_on_method_call'}, aggregate=False)
 
             for method, arg in self.logging_methods:
-                AuditEvent.reset_mock()
+                log_event.reset_mock()
                 m = getattr(lf, method)
                 if arg is None:
                     m()
@@ -52,6 +80,93 @@ class LoggingFileTests(TestCase):
 
                 expected_call_count = 1
                 msg = 'AuditLogging count {} != {} for LoggingFile.{}()'.format(
-                    AuditEvent.objects.create.call_count, expected_call_count, method
+                    log_event.call_count, expected_call_count, method
                 )
-                self.assertEqual(AuditEvent.objects.create.call_count, expected_call_count, msg)
+                self.assertEqual(log_event.call_count, expected_call_count, msg)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_aggregate(self, log_event):
+        with NamedTemporaryFile('w+') as tf:
+            with LoggingFile(tf, user_details={'username': 'test_aggregate'}, aggregate=True) as lf:
+                for i in range(100):
+                    lf.write('sample\n')
+                lf.seek(0)
+                lf.readline()
+                lf.read()
+                self.assertEqual(log_event.call_count, 0)
+
+        self.assertEqual(log_event.call_count, 2)
+        totals = {call[1]['event']: (call[1]['count'], call[1]['size']) for call in log_event.call_args_list}
+        self.assertEqual(totals, {'FileWrite': (100, 700), 'FileRead': (2, 700)})
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_aggregate_interval(self, log_event):
+        with NamedTemporaryFile('w+') as tf:
+            lf = LoggingFile(tf, user_details={'username': 'test_aggregate_interval'}, aggregate=True,
+                             aggregate_interval=0)
+            lf.write('sample')
+            self.assertEqual(log_event.call_count, 1)
+            lf.close()
+        self.assertEqual(log_event.call_count, 1)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_unclosed_file_logged(self, log_event):
+        with NamedTemporaryFile('w+') as tf:
+            lf = LoggingFile(tf, user_details={'username': 'test_unclosed_file_logged'}, aggregate=True)
+            lf.write('sample')
+            del lf
+            gc.collect()
+            self.assertEqual(log_event.call_count, 1)
+            self.assertEqual((log_event.call_args[1]['event'], log_event.call_args[1]['size']), ('FileWrite', 6))
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_text_size_in_bytes(self, log_event):
+        with NamedTemporaryFile('w+', encoding='utf-8') as tf:
+            with LoggingFile(tf, user_details={'username': 'test_text_size_in_bytes'}, aggregate=True) as lf:
+                lf.write('caf\u00e9\n')
+                lf.seek(0)
+                lf.readline()
+        totals = {call[1]['event']: call[1]['size'] for call in log_event.call_args_list}
+        self.assertEqual(totals, {'FileWrite': 6, 'FileRead': 6})
+
+
+class LoggingFileIterationTests(TestCase):
+
+    def setUp(self):
+        self.tf = NamedTemporaryFile('w+')
+        self.tf.write('line\n' * 1000)
+        self.tf.seek(0)
+
+    def tearDown(self):
+        self.tf.close()
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_iteration_logged_once(self, log_event):
+        lf = LoggingFile(self.tf, user_details={'username': 'test_iteration_logged_once'}, aggregate=False)
+        self.assertEqual(sum(1 for line in lf), 1000)
+
+        self.assertEqual(log_event.call_count, 1)
+        self.assertEqual(log_event.call_args[1]['event'], 'FileRead')
+        self.assertEqual(log_event.call_args[1]['count'], 1000)
+        self.assertEqual(log_event.call_args[1]['size'], 5000)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_abandoned_iteration_logged(self, log_event):
+        lf = LoggingFile(self.tf, user_details={'username': 'test_abandoned_iteration_logged'}, aggregate=False)
+        for i, line in enumerate(lf):
+            if i == 9:
+                break
+
+        self.assertEqual(log_event.call_count, 1)
+        self.assertEqual(log_event.call_args[1]['count'], 10)
+
+    @patch('audit_logging.file_logging.log_event')
+    def test_next_logged_on_close(self, log_event):
+        lf = LoggingFile(self.tf, user_details={'username': 'test_next_logged_on_close'}, aggregate=False)
+        next(lf)
+        next(lf)
+        self.assertEqual(log_event.call_count, 0)
+
+        lf.close()
+        self.assertEqual(log_event.call_count, 1)
+        self.assertEqual(log_event.call_args[1]['count'], 2)
@@ -0,0 +1,129 @@
+from tempfile import mkdtemp
+import json
+import os
+import shutil
+import threading
+from django.test import TestCase
+from mock import patch
+from audit_logging.log_file import AuditLogFile, open_segment, read_manifest, segments_between
+
+
+class AuditLogFileTests(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.location = os.path.join(self.directory, 'audit_log.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_entries(self, location=None):
+        with open(location or self.location) as f:
+            return [json.loads(line) for line in f]
+
+    def test_unbuffered_write(self):
+        log_file = AuditLogFile(self.location, buffer_size=0)
+        log_file.write({'event': 'create'})
+        log_file.write({'event': 'update'})
+        self.assertEqual(self.read_entries(), [{'event': 'create'}, {'event': 'update'}])
+        log_file.close()
+
+    def test_buffered_write(self):
+        log_file = AuditLogFile(self.location, buffer_size=1024, flush_interval=60)
+        log_file.write({'event': 'create'})
+        self.assertFalse(os.path.exists(self.location))
+
+        log_file.flush()
+        self.assertEqual(self.read_entries(), [{'event': 'create'}])
+        log_file.close()
+
+    def test_buffered_write_flushed_by_timer(self):
+        log_file = AuditLogFile(self.location, buffer_size=1024, flush_interval=0.05)
+        log_file.write({'event': 'create'})
+        self.assertFalse(os.path.exists(self.location))
+
+        log_file.flush_timer.join(5)
+        self.assertEqual(self.read_entries(), [{'event': 'create'}])
+        self.assertIsNone(log_file.flush_timer)
+        log_file.close()
+
+    def test_reopen(self):
+        log_file = AuditLogFile(self.location, buffer_size=0)
+        log_file.write({'event': 'create'})
+        rotated_location = self.location + '.1'
+        os.rename(self.location, rotated_location)
+
+        log_file.reopen()
+        log_file.write({'event': 'update'})
+        self.assertEqual(self.read_entries(rotated_location), [{'event': 'create'}])
+        self.assertEqual(self.read_entries(), [{'event': 'update'}])
+        log_file.close()
+
+    def test_forked_child_drops_parent_buffer(self):
+        log_file = AuditLogFile(self.location, buffer_size=1024, flush_interval=60)
+        log_file.write({'event': 'parent'})
+        with patch('audit_logging.log_file.os.getpid', return_value=log_file.pid + 1):
+            log_file.write({'event': 'child'})
+            log_file.flush()
+        self.assertEqual(self.read_entries(), [{'event': 'child'}])
+        log_file.close()
+
+
+class RotationTests(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.location = os.path.join(self.directory, 'audit_log.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rotate_on_size(self):
+        log_file = AuditLogFile(self.location, buffer_size=0, max_bytes=130, compression='gzip')
+        for i in range(6):
+            log_file.write({'event': 'create', 'event_time_gmt': '2017-06-01 00:00:0{}'.format(i)})
+        log_file.close()
+
+        manifest = read_manifest(self.location)
+        self.assertEqual(len(manifest), 2)
+        self.assertEqual(manifest[0]['first_event_time_gmt'], '2017-06-01 00:00:00')
+        self.assertEqual(manifest[0]['last_event_time_gmt'], '2017-06-01 00:00:01')
+        self.assertTrue(manifest[0]['segment'].endswith('.gz'))
+
+        entries = []
+        for path in segments_between(location=self.location):
+            with open_segment(path) as f:
+                entries.extend(json.loads(line)['event_time_gmt'] for line in f)
+        self.assertEqual(entries, ['2017-06-01 00:00:0{}'.format(i) for i in range(6)])
+
+    def test_segment_closed_outside_write(self):
+        log_file = AuditLogFile(self.location, buffer_size=0, max_bytes=130, compression='gzip')
+        threads = []
+        with patch('audit_logging.log_file.close_segment',
+                   side_effect=lambda *args: threads.append(threading.current_thread())):
+            for i in range(3):
+                log_file.write({'event': 'create', 'event_time_gmt': '2017-06-01 00:00:0{}'.format(i)})
+            log_file.close()
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_segments_between(self):
+        log_file = AuditLogFile(self.location, buffer_size=0, max_bytes=130)
+        for i in range(6):
+            log_file.write({'event': 'create', 'event_time_gmt': '2017-06-01 00:00:0{}'.format(i)})
+        log_file.close()
+
+        paths = segments_between('2017-06-01 00:00:02', '2017-06-01 00:00:03', location=self.location)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(paths[-1], self.location)
+
+    def test_rotated_by_other_process(self):
+        log_file = AuditLogFile(self.location, buffer_size=0, max_bytes=13000)
+        log_file.write({'event': 'create'})
+        os.rename(self.location, self.location + '.rotated')
+        log_file.write({'event': 'update'})
+        log_file.close()
+
+        with open(self.location) as f:
+            self.assertEqual([json.loads(line) for line in f], [{'event': 'update'}])
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from mock import patch
+from audit_logging_tests.models import OwnedModel
+from audit_logging.models import AuditEvent
+
+
+class AuditedQuerySetTests(TestCase):
+
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user('owner')
+        OwnedModel.objects.bulk_create([OwnedModel(owner=self.owner, field1='owned{}'.format(i)) for i in range(3)])
+
+    def get_events(self, event):
+        return sorted(AuditEvent.objects.filter(event=event).values_list('resource_uuid', flat=True))
+
+    def test_bulk_create(self):
+        self.assertEqual(self.get_events('create'), ['owned0', 'owned1', 'owned2'])
+
+    def test_update(self):
+        with self.assertNumQueries(3):
+            OwnedModel.objects.filter(field1__in=['owned0', 'owned1']).update(field1='changed')
+        self.assertEqual(self.get_events('update'), ['owned0', 'owned1'])
+
+    @patch('audit_logging.writers.write_events')
+    def test_delete_written_together(self, write_events):
+        OwnedModel.objects.all().delete()
+        write_events.assert_called_once()
+        self.assertEqual(len(write_events.call_args[0][0]), 3)
+
+    def test_delete_cascade(self):
+        self.owner.delete()
+        self.assertEqual(self.get_events('delete'), ['owned0', 'owned1', 'owned2'])
+
+    @patch('audit_logging.managers.write_entry')
+    @patch('audit_logging.managers.AUDIT_TO_FILE', True)
+    def test_owners_in_file_log(self, write_entry):
+        with self.assertNumQueries(3):
+            OwnedModel.objects.bulk_create([OwnedModel(owner=self.owner, field1='new{}'.format(i)) for i in range(5)])
+        self.assertEqual(set(call[0][0]['resource']['username'] for call in write_entry.call_args_list), {'owner'})
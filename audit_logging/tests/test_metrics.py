@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from mock import Mock, patch
+from audit_logging_tests.models import TestModel
+from audit_logging.metrics import Metrics, metrics
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_event_counted_and_timed(self):
+        TestModel.objects.create()
+
+        text = metrics.prometheus_text()
+        self.assertIn('audit_events_total{event="create"} 1\n', text)
+        self.assertIn('# TYPE audit_event_seconds histogram\n', text)
+        self.assertIn('audit_event_seconds_count{event="create"} 1\n', text)
+        self.assertIn('audit_event_seconds_bucket{event="create",le="+Inf"} 1\n', text)
+        self.assertIn('audit_sink_events_total{sink="db"} 1\n', text)
+
+    def test_error_counted(self):
+        with patch('audit_logging.writers.write_events', side_effect=RuntimeError('down')):
+            TestModel.objects.create()
+
+        self.assertIn(
+            'audit_errors_total{error="RuntimeError",stage="model_signal"} 1\n', metrics.prometheus_text()
+        )
+
+    def test_hooks_called(self):
+        hook = Mock()
+        m = Metrics(enabled=True, hooks=[])
+        m.add_hook(hook)
+        m.increment('audit_events_total', event='create')
+        m.observe('audit_event_seconds', 0.002, event='create')
+
+        hook.assert_any_call('counter', 'audit_events_total', 1, {'event': 'create'})
+        hook.assert_any_call('histogram', 'audit_event_seconds', 0.002, {'event': 'create'})
+
+    def test_disabled(self):
+        m = Metrics(enabled=False, hooks=[])
+        m.increment('audit_events_total', event='create')
+        with m.timer('audit_event_seconds', event='create'):
+            pass
+        self.assertEqual(m.prometheus_text(), '\n')
+
+
+class MetricsViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('metrics', password='metrics')
+
+    def test_forbidden(self):
+        self.client.login(username='metrics', password='metrics')
+        self.assertEqual(self.client.get('/audit/metrics/').status_code, 403)
+
+    def test_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='metrics', password='metrics')
+        response = self.client.get('/audit/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @patch('audit_logging.views.AUDIT_METRICS_TOKEN', 'secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/audit/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.client.get('/audit/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
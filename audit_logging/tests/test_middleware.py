@@ -0,0 +1,90 @@
+import asyncio
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils.functional import SimpleLazyObject
+from mock import Mock, patch
+from audit_logging.middleware import UserDetailsMiddleware
+from audit_logging.utils import alog_event, get_user_details
+from audit_logging.writers import EventDeduplicator, flush_deduplicated_events
+
+
+class UserDetailsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = get_user_model()(username='test', is_staff=True)
+        self.seen_user_details = []
+
+    def get_response(self, request):
+        self.seen_user_details.append(get_user_details())
+        return HttpResponse()
+
+    async def aget_response(self, request):
+        return self.get_response(request)
+
+    def test_sync(self):
+        middleware = UserDetailsMiddleware(self.get_response)
+        middleware(self.request)
+
+        self.assertEqual(self.seen_user_details[0]['username'], 'test')
+        self.assertTrue(self.seen_user_details[0]['is_staff'])
+        self.assertIsNone(get_user_details())
+
+    def test_async(self):
+        middleware = UserDetailsMiddleware(self.aget_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        async def concurrent_requests():
+            other_request = RequestFactory().get('/')
+            other_request.user = get_user_model()(username='other')
+            await asyncio.gather(middleware(self.request), middleware(other_request))
+
+        asyncio.get_event_loop().run_until_complete(concurrent_requests())
+        self.assertEqual(sorted(d['username'] for d in self.seen_user_details), ['other', 'test'])
+        self.assertIsNone(get_user_details())
+
+    def test_user_resolved_only_when_needed(self):
+        user = get_user_model()(username='test')
+        load_user = Mock(return_value=user)
+        self.request.user = SimpleLazyObject(load_user)
+
+        UserDetailsMiddleware(lambda request: HttpResponse())(self.request)
+        self.assertFalse(load_user.called)
+
+        def get_response(request):
+            self.get_response(request)
+            return self.get_response(request)
+
+        with patch.object(UserDetailsMiddleware, 'get_user_details', wraps=UserDetailsMiddleware.get_user_details,
+                          autospec=True) as get_details:
+            UserDetailsMiddleware(get_response)(self.request)
+        self.assertEqual(load_user.call_count, 1)
+        self.assertEqual(get_details.call_count, 1)
+        self.assertEqual([d['username'] for d in self.seen_user_details], ['test', 'test'])
+
+
+class AlogEventTests(TestCase):
+
+    @patch('audit_logging.utils.sync_to_async', None)
+    def test_alog_event(self):
+        with patch('audit_logging.utils.save_event') as save_event:
+            asyncio.get_event_loop().run_until_complete(
+                alog_event(event='FileRead', resource_uuid='test_alog_event', user_details={'username': 'test'})
+            )
+        self.assertEqual(save_event.call_count, 1)
+        self.assertEqual(save_event.call_args[0][0]['resource_uuid'], 'test_alog_event')
+
+    @patch('audit_logging.utils.AUDIT_ASYNC', True)
+    @patch('audit_logging.utils.AUDIT_DEDUP_WINDOW', 60)
+    def test_alog_event_deduplicated(self):
+        deduplicator = EventDeduplicator(window=60)
+        with patch('audit_logging.async_writer.async_writer', Mock(overflow='drop_oldest')) as async_writer, \
+                patch('audit_logging.writers.event_deduplicator', deduplicator):
+            for i in range(2):
+                asyncio.get_event_loop().run_until_complete(
+                    alog_event(event='FileRead', resource_uuid='test_alog_event', user_details={'username': 'test'})
+                )
+            async_writer.put.assert_not_called()
+            flush_deduplicated_events()
+        self.assertEqual(async_writer.put.call_args[0][0]['count'], 2)
@@ -1,6 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import ForeignKey
 from django.test import TestCase
-from audit_logging_tests.models import TestModel
+from django.utils import timezone
+from mock import patch
+from audit_logging_tests.models import NoisyModel, OwnedModel, TestModel
 from audit_logging.models import AuditEvent
+from audit_logging.utils import (
+    compile_audit_rule, end_actor_cache, get_audit_crud_dict, get_resource, get_resource_type, resource_type_cache,
+    start_actor_cache
+)
 
 class ModelAuditTests(TestCase):
     def setUp(self):
@@ -28,3 +37,122 @@ class ModelAuditTests(TestCase):
         latest_auditevent = AuditEvent.objects.order_by('-datetime').first()
         self.assertEqual(latest_auditevent.resource_type, 'TestModel')
         self.assertEqual(latest_auditevent.event, 'delete')
+
+
+class ResourceTypeTests(TestCase):
+
+    def test_audited_model(self):
+        self.assertEqual(get_resource_type(TestModel()), 'TestModel')
+        self.assertEqual(resource_type_cache[TestModel], 'TestModel')
+
+    def test_unaudited_model_cached(self):
+        self.assertIsNone(get_resource_type(AuditEvent()))
+        self.assertIn(AuditEvent, resource_type_cache)
+        self.assertIsNone(resource_type_cache[AuditEvent])
+
+
+class ModelSignalTests(TestCase):
+
+    @patch('audit_logging.signals.get_audit_crud_dict')
+    def test_unaudited_model_not_dispatched(self, get_audit_crud_dict):
+        get_audit_crud_dict.return_value = {}
+        get_user_model().objects.create(username='test_unaudited_model_not_dispatched')
+        self.assertEqual(get_audit_crud_dict.call_count, 0)
+
+        TestModel.objects.create()
+        self.assertEqual(get_audit_crud_dict.call_count, 1)
+
+
+class ActorCacheTests(TestCase):
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user('owner')
+        for i in range(3):
+            OwnedModel.objects.create(owner=owner, field1='owned{}'.format(i))
+        self.ids = list(OwnedModel.objects.values_list('id', flat=True))
+
+    def get_owner_usernames(self):
+        return [get_resource(OwnedModel.objects.get(id=id))['username'] for id in self.ids]
+
+    def test_owner_looked_up_once_per_request(self):
+        token = start_actor_cache()
+        try:
+            # One query per instance plus one for the owner.
+            with self.assertNumQueries(len(self.ids) + 1):
+                self.assertEqual(self.get_owner_usernames(), ['owner'] * len(self.ids))
+        finally:
+            end_actor_cache(token)
+
+    def test_not_cached_outside_request(self):
+        with self.assertNumQueries(len(self.ids) * 2):
+            self.get_owner_usernames()
+
+    def test_loaded_owner_used(self):
+        instance = OwnedModel.objects.select_related('owner').get(id=self.ids[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_resource(instance)['username'], 'owner')
+
+    def test_is_cached_used(self):
+        # Django 2.0+ reports loaded relations through is_cached(); get_cache_name() is then just the field name.
+        instance = OwnedModel.objects.get(id=self.ids[0])
+        with patch.object(ForeignKey, 'get_cache_name', return_value='owner'), \
+                patch.object(ForeignKey, 'is_cached', create=True, return_value=False) as is_cached:
+            with self.assertNumQueries(1):
+                self.assertEqual(get_resource(instance)['username'], 'owner')
+        is_cached.assert_called_with(instance)
+        self.assertFalse(hasattr(instance, '_owner_cache'))
+
+    def test_configured_id_field(self):
+        instance = OwnedModel.objects.get(id=self.ids[0])
+        self.assertEqual(get_resource(instance)['id'], 'owned0')
+
+    @patch('audit_logging.utils.AUDIT_TO_FILE', False)
+    def test_owner_not_loaded_without_file_log(self):
+        instance = OwnedModel.objects.get(id=self.ids[0])
+        with self.assertNumQueries(0):
+            d = get_audit_crud_dict(instance, 'update')
+        self.assertIsNone(d['resource']['username'])
+
+
+class AuditRuleTests(TestCase):
+
+    def get_events(self):
+        audit_events = AuditEvent.objects.filter(resource_type='NoisyModel').order_by('id')
+        return list(audit_events.values_list('event', flat=True))
+
+    def test_ignored_fields_not_recorded(self):
+        instance = NoisyModel.objects.create(field1='noisy')
+        instance.last_seen = timezone.now()
+        instance.visits += 1
+        with patch('audit_logging.signals.get_audit_crud_dict') as get_audit_crud_dict:
+            instance.save(update_fields=['last_seen', 'visits'])
+        self.assertEqual(get_audit_crud_dict.call_count, 0)
+
+        instance.save(update_fields=['field1', 'last_seen'])
+        instance.save()
+        self.assertEqual(self.get_events(), ['create', 'update', 'update'])
+
+    def test_events_not_recorded(self):
+        NoisyModel.objects.create(field1='noisy').delete()
+        self.assertEqual(self.get_events(), ['create'])
+
+    def test_bulk_operations(self):
+        NoisyModel.objects.bulk_create([NoisyModel(field1='noisy')])
+        NoisyModel.objects.update(visits=1)
+        NoisyModel.objects.update(field1='quiet')
+        NoisyModel.objects.all().delete()
+        self.assertEqual(self.get_events(), ['create', 'update'])
+
+    def test_only_fields(self):
+        rule = compile_audit_rule(OwnedModel, {'only_fields': ['owner']})
+        self.assertTrue(rule('update', ['owner_id']))
+        self.assertFalse(rule('update', ['field1']))
+        self.assertTrue(rule('update', None))
+        self.assertTrue(rule('delete'))
+
+    def test_no_rules(self):
+        self.assertIsNone(compile_audit_rule(TestModel, {'owner_field': None}))
+
+    def test_unknown_field(self):
+        with self.assertRaises(ImproperlyConfigured):
+            compile_audit_rule(TestModel, {'ignore_fields': ['missing']})
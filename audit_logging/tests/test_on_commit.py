@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+from mock import patch
+from audit_logging_tests.models import TestModel
+from audit_logging.models import AuditEvent
+
+
+@patch('audit_logging.utils.AUDIT_ON_COMMIT', True)
+class OnCommitTests(TransactionTestCase):
+
+    @patch('audit_logging.writers.write_events')
+    def test_written_once_on_commit(self, write_events):
+        with transaction.atomic():
+            for i in range(3):
+                TestModel.objects.create()
+            write_events.assert_not_called()
+        write_events.assert_called_once()
+        self.assertEqual(len(write_events.call_args[0][0]), 3)
+
+    def test_discarded_on_rollback(self):
+        try:
+            with transaction.atomic():
+                TestModel.objects.create()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_savepoint_rollback(self):
+        with transaction.atomic():
+            kept = TestModel.objects.create()
+            try:
+                with transaction.atomic():
+                    TestModel.objects.create()
+                    raise ValueError()
+            except ValueError:
+                pass
+            TestModel.objects.create(field1='after')
+        self.assertEqual(AuditEvent.objects.filter(event='create').count(), 2)
+        self.assertTrue(AuditEvent.objects.filter(resource_uuid=kept.id).exists())
+
+    def test_autocommit_written_immediately(self):
+        TestModel.objects.create()
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+    def test_write_failure_logged(self):
+        with patch('audit_logging.writers.write_events', side_effect=RuntimeError('down')), \
+                patch('audit_logging.utils.logger') as logger:
+            with transaction.atomic():
+                TestModel.objects.create()
+        self.assertTrue(TestModel.objects.exists())
+        logger.exception.assert_called_once_with('Exception saving audit events on commit.')
+
+    @patch('audit_logging.signals.AUDIT_TO_FILE', True)
+    @patch('audit_logging.utils.audit_log_file')
+    def test_file_entries_discarded_on_rollback(self, audit_log_file):
+        try:
+            with transaction.atomic():
+                TestModel.objects.create()
+                raise ValueError()
+        except ValueError:
+            pass
+        audit_log_file.write.assert_not_called()
+
+        with transaction.atomic():
+            TestModel.objects.create()
+            audit_log_file.write.assert_not_called()
+        self.assertEqual(audit_log_file.write.call_count, 1)
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from audit_logging.compact import clear_caches, compact_event
+from audit_logging.models import AuditEvent, CompactAuditEvent
+from audit_logging.partitioning import add_periods, get_partitioner, period_start, retention_cutoff
+from audit_logging.utils import build_event_record
+
+
+class PeriodTests(TestCase):
+
+    def test_monthly(self):
+        dt = datetime(2017, 12, 15, 10, 30, tzinfo=timezone.utc)
+        start = period_start(dt, 'monthly')
+        self.assertEqual(start, datetime(2017, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_periods(start, 'monthly', 1), datetime(2018, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(retention_cutoff(dt, 'monthly', 12), datetime(2016, 12, 1, tzinfo=timezone.utc))
+
+    def test_daily(self):
+        dt = datetime(2017, 12, 31, 10, 30, tzinfo=timezone.utc)
+        start = period_start(dt, 'daily')
+        self.assertEqual(add_periods(start, 'daily', 1), datetime(2018, 1, 1, tzinfo=timezone.utc))
+
+
+class RollingTablesTests(TestCase):
+
+    def test_rotate_and_expire(self):
+        now = timezone.now()
+        AuditEvent.objects.create(event='create', datetime=now - timedelta(days=3))
+        last_id = AuditEvent.objects.create(event='create', datetime=now).id
+        partitioner = get_partitioner(connection, 'daily')
+        self.assertTrue(partitioner.rotation_due(now))
+
+        rolled = partitioner.rotate(now)
+        self.assertFalse(AuditEvent.objects.exists())
+        self.assertFalse(partitioner.rotation_due(now))
+        self.assertGreater(AuditEvent.objects.create(event='update').id, last_id)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM {}'.format(connection.ops.quote_name(rolled)))
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+        self.assertEqual([p[0] for p in partitioner.partitions()], [rolled])
+        self.assertEqual(partitioner.expired(retention_cutoff(now, 'daily', 0)), [])
+        self.assertEqual(partitioner.expired(retention_cutoff(now + timedelta(days=1), 'daily', 0)), [rolled])
+
+    def test_command(self):
+        AuditEvent.objects.create(event='create', datetime=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('audit_partitions', period='daily', retain=0, stdout=out)
+        self.assertIn('Rolled', out.getvalue())
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_rotate_again_with_late_rows(self):
+        now = timezone.now()
+        AuditEvent.objects.create(event='create', datetime=now - timedelta(days=3))
+        partitioner = get_partitioner(connection, 'daily')
+        rolled = partitioner.rotate(now)
+        # E.g. a buffered or spilled event written after the rollover.
+        AuditEvent.objects.create(event='update', datetime=now - timedelta(days=3))
+        self.assertTrue(partitioner.rotation_due(now))
+
+        rolled_again = partitioner.rotate(now)
+        self.assertEqual(rolled_again, rolled + '_2')
+        self.assertFalse(AuditEvent.objects.exists())
+        self.assertEqual([p[0] for p in partitioner.partitions()], [rolled, rolled_again])
+        cutoff = retention_cutoff(now + timedelta(days=1), 'daily', 0)
+        self.assertEqual(partitioner.expired(cutoff), [rolled, rolled_again])
+
+    def test_command_dry_run(self):
+        AuditEvent.objects.create(event='create', datetime=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('audit_partitions', period='daily', retain=0, dry_run=True, stdout=out)
+        self.assertIn('Would roll', out.getvalue())
+        self.assertTrue(AuditEvent.objects.exists())
+        self.assertEqual(get_partitioner(connection, 'daily').partitions(), [])
+
+    def test_compact_storage(self):
+        clear_caches()
+        record = build_event_record(event='create', user_details={'username': 'test'})
+        record['datetime'] = timezone.now() - timedelta(days=2)
+        compact_event(record).save()
+        AuditEvent.objects.create(event='create', datetime=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('audit_partitions', period='daily', retain=0, storage='compact', stdout=out)
+        self.assertIn('Rolled audit_logging_compactauditevent', out.getvalue())
+        self.assertFalse(CompactAuditEvent.objects.exists())
+        self.assertTrue(AuditEvent.objects.exists())
+        self.assertEqual(get_partitioner(connection, 'daily').partitions(), [])
@@ -0,0 +1,202 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from mock import patch
+from audit_logging.compact import clear_caches
+from audit_logging.models import AuditActor, AuditEvent, CompactAuditEvent
+from audit_logging.utils import build_event_record, save_event
+from audit_logging.writers import EventBuffer, EventDeduplicator, flush_deduplicated_events, write_events
+
+
+class WriteEventsTests(TestCase):
+
+    def test_records_written(self):
+        records = [build_event_record(event='create', resource_type='TestModel', resource_uuid=i) for i in range(3)]
+        write_events(records)
+        self.assertEqual(AuditEvent.objects.filter(event='create', resource_type='TestModel').count(), 3)
+
+    def test_login_details_written(self):
+        user_details = {'username': 'test', 'ip': '127.0.0.1', 'superuser': True, 'staff': False}
+        write_events([build_event_record(event='login', user_details=user_details)])
+        audit_event = AuditEvent.objects.get(event='login')
+        self.assertEqual(audit_event.ip, '127.0.0.1')
+        self.assertTrue(audit_event.superuser)
+        self.assertFalse(audit_event.staff)
+
+
+@patch('audit_logging.writers.AUDIT_STORAGE', 'compact')
+class CompactStorageTests(TransactionTestCase):
+    """ Outside TestCase's transaction, since lookup ids are only cached once the rows are committed.
+    """
+
+    def setUp(self):
+        clear_caches()
+
+    def test_lookups_shared(self):
+        user_details = {'username': 'test', 'email': 'test@example.com', 'superuser': False, 'staff': True}
+        write_events([
+            build_event_record(event='update', resource_type='layer', resource_uuid=i, user_details=user_details)
+            for i in range(3)
+        ])
+        self.assertFalse(AuditEvent.objects.exists())
+        self.assertEqual(CompactAuditEvent.objects.count(), 3)
+        self.assertEqual(AuditActor.objects.count(), 1)
+
+        compact = CompactAuditEvent.objects.select_related('event', 'actor', 'resource_type').first()
+        audit_event = compact.to_audit_event()
+        self.assertEqual(audit_event.event, 'update')
+        self.assertEqual(audit_event.resource_type, 'layer')
+        self.assertEqual(audit_event.email, 'test@example.com')
+        self.assertTrue(audit_event.staff)
+
+    def test_cached_ids(self):
+        write_events([build_event_record(event='login', user_details={'username': 'test'})])
+        with CaptureQueriesContext(connection) as queries:
+            write_events([build_event_record(event='login', user_details={'username': 'test'})])
+        # Only the INSERT (and its BEGIN), no lookups.
+        self.assertEqual([query['sql'].split()[0] for query in queries if query['sql'] != 'BEGIN'], ['INSERT'])
+        self.assertIsNone(CompactAuditEvent.objects.first().to_audit_event().resource_type)
+
+    def test_rolled_back_lookups_not_cached(self):
+        try:
+            with transaction.atomic():
+                write_events([build_event_record(event='login', user_details={'username': 'rolled back'})])
+                write_events([build_event_record(event='login', user_details={'username': 'rolled back'})])
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        write_events([build_event_record(event='login', user_details={'username': 'rolled back'})])
+
+        audit_event = CompactAuditEvent.objects.select_related('event', 'actor').get().to_audit_event()
+        self.assertEqual((audit_event.event, audit_event.username), ('login', 'rolled back'))
+
+
+class EventBufferTests(TransactionTestCase):
+    """ Outside TestCase's transaction, since flushes due inside one wait for it to commit.
+    """
+
+    @patch('audit_logging.writers.write_events')
+    def test_flush_on_size(self, write_events):
+        buffer = EventBuffer(max_size=3, interval=60)
+        for i in range(2):
+            buffer.add(build_event_record(event='create'))
+        self.assertEqual(write_events.call_count, 0)
+
+        buffer.add(build_event_record(event='create'))
+        self.assertEqual(write_events.call_count, 1)
+        self.assertEqual(len(write_events.call_args[0][0]), 3)
+        self.assertEqual(len(buffer), 0)
+
+    @patch('audit_logging.writers.write_events')
+    def test_flush_on_interval(self, write_events):
+        buffer = EventBuffer(max_size=100, interval=0)
+        buffer.add(build_event_record(event='create'))
+        self.assertEqual(write_events.call_count, 1)
+
+    def test_flush_on_timer(self):
+        buffer = EventBuffer(max_size=100, interval=0.05)
+        buffer.add(build_event_record(event='create', resource_uuid='idle'))
+        self.assertFalse(AuditEvent.objects.exists())
+        timer = buffer.flush_timer
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(len(buffer), 0)
+        self.assertTrue(AuditEvent.objects.filter(resource_uuid='idle').exists())
+
+    def test_flush_deferred_in_transaction(self):
+        buffer = EventBuffer(max_size=2, interval=60)
+        buffer.add(build_event_record(event='create', resource_uuid='outside'))
+        try:
+            with transaction.atomic():
+                buffer.add(build_event_record(event='create', resource_uuid='inside'))
+                self.assertEqual(len(buffer), 2)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(len(buffer), 2)
+
+        buffer.flush()
+        self.assertEqual(AuditEvent.objects.filter(event='create').count(), 2)
+
+    def test_buffered_save_event(self):
+        buffer = EventBuffer(max_size=100, interval=60)
+        with patch('audit_logging.utils.AUDIT_BUFFER_EVENTS', True), \
+                patch('audit_logging.writers.event_buffer', buffer):
+            save_event(build_event_record(event='update', resource_type='TestModel'))
+            self.assertFalse(AuditEvent.objects.filter(event='update').exists())
+            buffer.flush()
+        self.assertTrue(AuditEvent.objects.filter(event='update').exists())
+
+
+class EventDeduplicatorTests(TestCase):
+
+    def record(self, resource_uuid='a', seconds_ago=0, **kwargs):
+        record = build_event_record(
+            event='FileRead', resource_uuid=resource_uuid, user_details={'username': 'test'}, **kwargs
+        )
+        record['datetime'] -= timedelta(seconds=seconds_ago)
+        return record
+
+    def test_repeats_collapsed(self):
+        deduplicator = EventDeduplicator(window=60)
+        with patch('audit_logging.utils.AUDIT_DEDUP_WINDOW', 60), \
+                patch('audit_logging.writers.event_deduplicator', deduplicator):
+            for i in range(3):
+                save_event(self.record(size=10))
+            save_event(self.record('b'))
+            self.assertFalse(AuditEvent.objects.exists())
+            flush_deduplicated_events()
+
+        audit_event = AuditEvent.objects.get(resource_uuid='a')
+        self.assertEqual((audit_event.count, audit_event.size), (3, 30))
+        self.assertGreaterEqual(audit_event.last_datetime, audit_event.datetime)
+        self.assertEqual(AuditEvent.objects.get(resource_uuid='b').count, 1)
+        self.assertIsNone(AuditEvent.objects.get(resource_uuid='b').last_datetime)
+
+    def test_released_after_window(self):
+        deduplicator = EventDeduplicator(window=60)
+        self.assertEqual(deduplicator.add([self.record(seconds_ago=50), self.record(seconds_ago=40)]), [])
+        self.assertFalse(deduplicator.has_expired())
+
+        with patch('audit_logging.writers.timezone.now', return_value=timezone.now() + timedelta(seconds=20)):
+            self.assertTrue(deduplicator.has_expired())
+            released = deduplicator.add([self.record()])
+        self.assertEqual([record['count'] for record in released], [2])
+        self.assertEqual(len(deduplicator), 1)
+        self.assertFalse(deduplicator.has_expired())
+
+    def test_least_recently_repeated_released(self):
+        deduplicator = EventDeduplicator(window=60, max_size=2)
+        deduplicator.add([self.record('a'), self.record('b'), self.record('a')])
+        released = deduplicator.add([self.record('c')])
+        self.assertEqual([record['resource_uuid'] for record in released], ['b'])
+
+    def test_release_expired_only(self):
+        deduplicator = EventDeduplicator(window=60)
+        deduplicator.add([self.record('a', seconds_ago=50), self.record('b')])
+        with patch('audit_logging.writers.timezone.now', return_value=timezone.now() + timedelta(seconds=20)):
+            released = deduplicator.release(expired_only=True)
+        self.assertEqual([record['resource_uuid'] for record in released], ['a'])
+        self.assertEqual(len(deduplicator), 1)
+
+    def test_expiries_spread_over_time(self):
+        deduplicator = EventDeduplicator(window=60, max_size=900)
+        # Records seen 0 to 59 seconds ago, the oldest 100 released for max_size and leaving stale heap entries.
+        deduplicator.add([self.record(str(i), seconds_ago=59 - i * 0.059) for i in range(1000)])
+        self.assertEqual(len(deduplicator), 900)
+        start = timezone.now()
+        released = []
+        for second in range(1, 61):
+            with patch('audit_logging.writers.timezone.now', return_value=start + timedelta(seconds=second)):
+                released.extend(deduplicator.release(expired_only=True))
+                self.assertEqual(len(deduplicator) + len(released), 900)
+                self.assertTrue(all(
+                    start + timedelta(seconds=second) - record['datetime'] < timedelta(seconds=60)
+                    for record in deduplicator.held.values()
+                ))
+        self.assertEqual(len(deduplicator), 0)
+        self.assertEqual([record['resource_uuid'] for record in released], [str(i) for i in range(100, 1000)])
+        self.assertEqual(deduplicator.expiries, [])
+        self.assertIsNone(deduplicator.next_expiry)
@@ -0,0 +1,8 @@
+from django.conf.urls import url
+
+from audit_logging import views
+
+urlpatterns = [
+    url(r'^export/$', views.export_audit_events, name='audit_logging_export'),
+    url(r'^metrics/$', views.audit_metrics, name='audit_logging_metrics'),
+]
@@ -18,39 +18,265 @@
 #
 #########################################################################
 
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import functools
 from importlib import import_module
-import json
 from logging import getLogger
 from time import gmtime, strftime
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from audit_logging.audit_settings import AUDIT_LOGFILE_LOCATION
-import threading
+from audit_logging.audit_settings import (
+    AUDIT_BUFFER_EVENTS, AUDIT_ASYNC, AUDIT_DEDUP_WINDOW, AUDIT_ON_COMMIT, AUDIT_TO_FILE
+)
+from audit_logging.log_file import audit_log_file
+from audit_logging.metrics import metrics
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
 
 
 logger = getLogger(__name__)
-audit_logging_thread_local = threading.local()
+# Details of the user responsible for events in the current request or task (see UserDetailsMiddleware and
+#   celery_support.UserDetailsBase).  A context variable rather than thread-local storage so concurrent requests
+#   served by the same thread under ASGI each see their own user.
+audit_user_details = ContextVar('audit_user_details', default=None)
+
+
+class LazyUserDetails(object):
+    """ User details looked up by resolve() the first time an event needs them, then kept, so requests that
+        record no events never load their user.
+    """
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.resolved = False
+        self.user_details = None
+
+    def get(self):
+        if not self.resolved:
+            self.user_details = self.resolve()
+            self.resolved = True
+        return self.user_details
+
+
+def get_user_details():
+    user_details = audit_user_details.get()
+    if isinstance(user_details, LazyUserDetails):
+        return user_details.get()
+    return user_details
+
+
+def set_user_details(user_details):
+    """ @param user_details: A dict, None or a LazyUserDetails.
+        @return: Token to pass to reset_user_details() to restore the previous user details.
+    """
+    return audit_user_details.set(user_details)
+
+
+def reset_user_details(token):
+    audit_user_details.reset(token)
+
+
+# Details of users & owner usernames already looked up in the current request or task, {<key>: <value>}, so
+#   auditing many events for the same user doesn't repeat the lookups.  None (nothing cached) outside a request/task.
+audit_actor_cache = ContextVar('audit_actor_cache', default=None)
+
+
+def start_actor_cache():
+    """ @return: Token to pass to end_actor_cache() to discard what was cached.
+    """
+    return audit_actor_cache.set({})
+
+
+def end_actor_cache(token):
+    audit_actor_cache.reset(token)
 
 
-def log_event(event=None, resource_type='file', resource_uuid=None, user_details=None):
+def get_cached_actor_value(key, resolve):
+    """ @return: The value cached for key in the current request/task, calling resolve() to get it on a miss.
+    """
+    cache = audit_actor_cache.get()
+    if cache is None:
+        return resolve()
+    try:
+        return cache[key]
+    except KeyError:
+        value = cache[key] = resolve()
+        return value
+
+
+def log_event(event=None, resource_type='file', resource_uuid=None, user_details=None, count=1, size=None):
+    with metrics.timer('audit_event_seconds', event=event):
+        try:
+            record = build_event_record(
+                event=event, resource_type=resource_type, resource_uuid=resource_uuid, user_details=user_details,
+                count=count, size=size
+            )
+            save_event(record)
+        except Exception as ex:
+            logger.exception('Exception recording {} event.'.format(event))
+            metrics.count_error('log_event', ex)
+
+
+async def alog_event(event=None, resource_type='file', resource_uuid=None, user_details=None, count=1, size=None):
+    """ Equivalent of log_event() for async code; the database write happens in a worker thread (or on the
+        background writer's queue when AUDIT_ASYNC is set and can't block) so the event loop isn't blocked.
+    """
     try:
-        from audit_logging.models import AuditEvent
-        username = user_details.get('username') if user_details else None
-        is_superuser = user_details.get('is_superuser') if user_details else None
-        is_staff = user_details.get('is_staff') if user_details else None
-        AuditEvent.objects.create(
-            event=event, resource_type=resource_type, resource_uuid=resource_uuid, username=username,
-            superuser=is_superuser, staff=is_staff
+        record = build_event_record(
+            event=event, resource_type=resource_type, resource_uuid=resource_uuid, user_details=user_details,
+            count=count, size=size
         )
+        if AUDIT_ASYNC:
+            from audit_logging.async_writer import async_writer
+            if async_writer.overflow != 'block':
+                # Only queues the record (after deduplication), so there's no need for a worker thread.
+                dispatch_events([record])
+                return
+        await run_sync(save_event, record)
     except Exception as ex:
-        pass
+        logger.exception('Exception recording {} event.'.format(event))
+        metrics.count_error('log_event', ex)
+
+
+async def run_sync(func, *args):
+    """ Runs func(*args) in a worker thread, using asgiref (which also manages database connections) if available.
+    """
+    if sync_to_async is not None:
+        return await sync_to_async(func)(*args)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+def build_event_record(event=None, resource_type=None, resource_uuid=None, user_details=None, count=1, size=None):
+    """ Returns a dict of AuditEvent field values for an event.
+        user_details may come from UserDetailsMiddleware (is_superuser/is_staff) or from get_audit_login_dict()
+            (superuser/staff, plus ip, email & fullname).
+        count & size describe events aggregated into a single record, e.g. several reads of the same file.
+    """
+    user_details = user_details or {}
+    record = {
+        'event': event,
+        'datetime': timezone.now(),
+        'username': user_details.get('username'),
+        'ip': user_details.get('ip'),
+        'email': user_details.get('email'),
+        'fullname': user_details.get('fullname'),
+        'superuser': user_details.get('is_superuser', user_details.get('superuser')),
+        'staff': user_details.get('is_staff', user_details.get('staff')),
+        'resource_type': resource_type,
+        'resource_uuid': resource_uuid,
+        'count': count,
+        'size': size,
+    }
+    return record
+
+
+# List the event records saved inside a collect_events() block are added to, or None outside one.
+audit_event_collector = ContextVar('audit_event_collector', default=None)
+
+
+def save_event(record):
+    """ Persists an event record built by build_event_record(), either immediately, through the background writer
+        thread when AUDIT_ASYNC is set or through the event buffer when AUDIT_BUFFER_EVENTS is set.
+        Inside a collect_events() block the record is only collected.
+    """
+    collector = audit_event_collector.get()
+    if collector is not None:
+        collector.append(record)
+    else:
+        save_events([record])
+
+
+def save_events(records):
+    """ Persists several event records like save_event(), with a single INSERT when they're written immediately.
+        With AUDIT_ON_COMMIT, records saved in a transaction are persisted together when it commits and discarded
+        if it's rolled back.
+    """
+    if AUDIT_ON_COMMIT and transaction.get_connection().in_atomic_block:
+        from audit_logging.writers import save_on_commit
+        for record in records:
+            save_on_commit(record, dispatch_committed_events)
+    else:
+        dispatch_events(records)
+
+
+def dispatch_committed_events(records):
+    """ dispatch_events() for save_events()' transaction.on_commit() callback.  The caller's data is committed by
+        then, so an exception is logged rather than raised out of their atomic block (which would also skip the
+        remaining on_commit callbacks before Django 3.2).
+    """
+    try:
+        dispatch_events(records)
+    except Exception as ex:
+        logger.exception('Exception saving audit events on commit.')
+        metrics.count_error('on_commit', ex)
+
+
+def dispatch_events(records):
+    """ Hands event records to the background writer, the event buffer or write_events() as configured, after
+        collapsing repeats with writers.event_deduplicator when AUDIT_DEDUP_WINDOW is set.
+    """
+    if AUDIT_DEDUP_WINDOW:
+        from audit_logging.writers import event_deduplicator
+        records = event_deduplicator.add(records)
+        if not records:
+            return
+    route_events(records)
+
+
+def route_events(records):
+    from audit_logging.writers import event_buffer, write_events
+    for record in records:
+        metrics.increment('audit_events_total', event=record['event'])
+    if AUDIT_ASYNC:
+        from audit_logging.async_writer import async_writer
+        for record in records:
+            async_writer.put(record)
+    elif AUDIT_BUFFER_EVENTS:
+        for record in records:
+            event_buffer.add(record)
+    else:
+        write_events(records)
+
+
+@contextmanager
+def collect_events():
+    """ Collects the event records saved in the block and saves them together with save_events() when it completes
+        (but not if it raises).  Nested blocks collect into the outermost one.
+    """
+    if audit_event_collector.get() is not None:
+        yield
+        return
+    records = []
+    token = audit_event_collector.set(records)
+    try:
+        yield
+    finally:
+        audit_event_collector.reset(token)
+    save_events(records)
 
 
 def configure_audit_models():
     """ Imports models specified in settings variable AUDIT_MODELS.
         AUDIT_MODELS is a list with elements of the form (<dotted-path-to-model>, <resource-type>), both of which are
-            strings.
+            strings, or (<dotted-path-to-model>, <resource-type>, <options>) where options is a dict with any of:
+            'owner_field': Name of the field referring to the user who owns instances, or None if there isn't one
+                (default: the first of 'user' & 'owner' that's set).
+            'id_field': Name of the field recorded as the resource id (default: the first of 'uuid', 'uid' & 'id').
+            'events': The events recorded, e.g. ['create', 'delete'] (default: all of them).
+            'ignore_fields': Fields whose updates aren't worth an event: an update of only these fields isn't recorded.
+            'only_fields': Fields whose updates are worth an event: an update of none of these fields isn't recorded.
+            The last three are compiled into a rule (see compile_audit_rule()) checked before an event is recorded.
         @return: {<resource-type>: <model>, ...}
     """
     cached_return_value = getattr(configure_audit_models, 'cached_return_value', None)
@@ -62,31 +288,208 @@ def configure_audit_models():
         logger.warn('No models specified for audit, you probably forgot to set AUDIT_MODELS.')
 
     audit_model_lookup = {}
+    options_by_model = {}
+    rule_by_model = {}
     logger.info('Registering models for auditing:')
-    for dotted_path, resource_type in audit_model_specs:
+    for spec in audit_model_specs:
+        dotted_path, resource_type = spec[:2]
+        options = spec[2] if len(spec) > 2 else {}
+        unknown_options = set(options) - set(AUDIT_MODEL_OPTIONS)
+        if unknown_options:
+            raise ImproperlyConfigured(
+                'Unknown AUDIT_MODELS option(s) {} for {}'.format(', '.join(sorted(unknown_options)), dotted_path)
+            )
         logger.info('{} recorded as {}'.format(dotted_path, resource_type))
         module_dotted_path, model_name = dotted_path.rsplit('.', 1)
         model_module = import_module(module_dotted_path)
         model_to_audit = getattr(model_module, model_name)
         audit_model_lookup.update({resource_type: model_to_audit})
+        options_by_model[model_to_audit] = options
+        rule_by_model[model_to_audit] = compile_audit_rule(model_to_audit, options)
 
+    # Reverse index used by get_resource_type()
+    configure_audit_models.resource_type_by_model = {
+        model: resource_type for resource_type, model in audit_model_lookup.items()
+    }
+    # Used by get_audit_options()
+    configure_audit_models.options_by_model = options_by_model
+    # Used by get_model_audit_rule()
+    configure_audit_models.rule_by_model = rule_by_model
     configure_audit_models.cached_return_value = audit_model_lookup
     return audit_model_lookup
 
 
+AUDIT_MODEL_OPTIONS = ('owner_field', 'id_field', 'events', 'ignore_fields', 'only_fields')
+# Fields tried in order for models without the owner_field / id_field option.
+DEFAULT_OWNER_FIELDS = ['user', 'owner']
+DEFAULT_ID_FIELDS = ['uuid', 'uid', 'id']
+# {<class>: <resource-type> or None, ...} filled in by get_resource_type() as classes are seen.
+resource_type_cache = {}
+# {<class>: <AUDIT_MODELS options of its nearest audited ancestor>, ...} filled in by get_model_audit_options().
+audit_options_cache = {}
+# {<class>: <rule of its nearest audited ancestor> or None, ...} filled in by get_model_audit_rule().
+audit_rule_cache = {}
+
+
+def get_resource_type(instance):
+    """ Returns the resource type instance is audited as, or None if its class isn't configured for auditing.
+        A subclass of an audited model is audited as its nearest audited ancestor.  The answer is cached per class
+        (including None for unaudited classes) so after the first instance of a class this is a single dict lookup.
+    """
+    return get_model_resource_type(type(instance))
+
+
+def get_model_resource_type(cls):
+    """ Returns the resource type instances of cls are audited as, or None; see get_resource_type().
+    """
+    try:
+        return resource_type_cache[cls]
+    except KeyError:
+        pass
+
+    configure_audit_models()
+    resource_type_by_model = configure_audit_models.resource_type_by_model
+    resource_type = None
+    for ancestor in cls.__mro__:
+        if ancestor in resource_type_by_model:
+            resource_type = resource_type_by_model[ancestor]
+            break
+
+    resource_type_cache[cls] = resource_type
+    return resource_type
+
+
+def get_audit_options(instance):
+    """ Returns the AUDIT_MODELS options for instance's class (see configure_audit_models()).
+    """
+    return get_model_audit_options(type(instance))
+
+
+def get_model_audit_options(cls):
+    """ Returns the AUDIT_MODELS options of the nearest audited ancestor of cls, cached per class.
+    """
+    try:
+        return audit_options_cache[cls]
+    except KeyError:
+        pass
+
+    configure_audit_models()
+    options_by_model = configure_audit_models.options_by_model
+    options = {}
+    for ancestor in cls.__mro__:
+        if ancestor in options_by_model:
+            options = options_by_model[ancestor]
+            break
+
+    audit_options_cache[cls] = options
+    return options
+
+
+def compile_audit_rule(model, options):
+    """ Turns the 'events', 'ignore_fields' & 'only_fields' options of an audited model into a predicate
+        rule(event, update_fields) telling whether an event is recorded.  update_fields are the names of the fields
+        an update wrote (as passed to save() or QuerySet.update()), or None if unknown, e.g. for a save() without
+        update_fields, which is recorded.
+        @return: The rule, or None if every event is recorded.
+        @raise ImproperlyConfigured: If a field isn't a field of model.
+    """
+    events = options.get('events')
+    ignore_fields = options.get('ignore_fields') or ()
+    only_fields = options.get('only_fields') or ()
+    if events is None and not ignore_fields and not only_fields:
+        return None
+
+    def field_names(names):
+        # update_fields may name a foreign key by its attname ('owner_id') as well as its name.
+        result = set()
+        for name in names:
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured('AUDIT_MODELS field {} is not a field of {}'.format(name, model.__name__))
+            result.update([field.name, getattr(field, 'attname', field.name)])
+        return frozenset(result)
+
+    events = frozenset(events) if events is not None else None
+    ignore_fields = field_names(ignore_fields)
+    only_fields = field_names(only_fields)
+
+    def rule(event, update_fields=None):
+        if events is not None and event not in events:
+            return False
+        if event != 'update' or update_fields is None:
+            return True
+        if ignore_fields and ignore_fields.issuperset(update_fields):
+            return False
+        if only_fields and only_fields.isdisjoint(update_fields):
+            return False
+        return True
+
+    return rule
+
+
+def get_model_audit_rule(cls):
+    """ Returns the rule (see compile_audit_rule()) of the nearest audited ancestor of cls, cached per class,
+        or None if every event is recorded.
+    """
+    try:
+        return audit_rule_cache[cls]
+    except KeyError:
+        pass
+
+    configure_audit_models()
+    rule_by_model = configure_audit_models.rule_by_model
+    rule = None
+    for ancestor in cls.__mro__:
+        if ancestor in rule_by_model:
+            rule = rule_by_model[ancestor]
+            break
+
+    audit_rule_cache[cls] = rule
+    return rule
+
+
+def is_event_audited(cls, event, update_fields=None):
+    """ @return: False if the AUDIT_MODELS rules of cls exclude event (see compile_audit_rule()).
+    """
+    rule = get_model_audit_rule(cls)
+    return rule is None or rule(event, update_fields)
+
+
+def get_owner_fields(cls):
+    """ @return: Names of the fields tried in order for the owner of instances of cls.
+    """
+    options = get_model_audit_options(cls)
+    if 'owner_field' in options:
+        return [options['owner_field']] if options['owner_field'] else []
+    return DEFAULT_OWNER_FIELDS
+
+
+def get_resource_id_field(cls):
+    """ @return: Name of the field of cls recorded as the resource id in bulk operations (see get_resource()).
+    """
+    options = get_model_audit_options(cls)
+    if 'id_field' in options:
+        return options['id_field']
+    field_names = set(field.name for field in cls._meta.concrete_fields)
+    for id_field in DEFAULT_ID_FIELDS:
+        if id_field in field_names:
+            return id_field
+    return cls._meta.pk.name
+
+
 def get_audit_crud_dict(instance, event):
     """ Get details for instance and return as dictionary
         return None if the model isn't configured for auditing.
     """
-    audit_model_lookup = configure_audit_models()
     d = {}
-    for idx, item in enumerate(audit_model_lookup.values()):
-        if isinstance(instance, item):
-            # populate resource details from instance
-            d['resource'] = get_resource(instance)
-            d['event'] = event
-            d['event_time_gmt'] = get_time_gmt()
-            break
+    resource_type = get_resource_type(instance)
+    if resource_type is not None:
+        # populate resource details from instance
+        # The owner's username is only recorded in the AUDIT_TO_FILE log, so don't look it up otherwise.
+        d['resource'] = get_resource(instance, resource_type, resolve_username=AUDIT_TO_FILE)
+        d['event'] = event
+        d['event_time_gmt'] = get_time_gmt()
 
     logger.debug('CRUD details for {}: {}'.format(instance, d))
 
@@ -95,15 +498,16 @@ def get_audit_crud_dict(instance, event):
 
 def get_audit_login_dict(request, user, event):
     """get user login details and return as user_details dictionary"""
+    user_details = dict(get_cached_actor_value(('login', user.pk), lambda: {
+        "username": getattr(user, user.USERNAME_FIELD),
+        "superuser": user.is_superuser,
+        "staff": user.is_staff,
+        "fullname": user.get_full_name() or None,
+        "email": user.email or None
+    }))
+    user_details["ip"] = get_client_ip(request)
     d = {
-        "user_details": {
-            "username": getattr(user, user.USERNAME_FIELD),
-            "ip": get_client_ip(request),
-            "superuser": user.is_superuser,
-            "staff": user.is_staff,
-            "fullname": user.get_full_name() or None,
-            "email": user.email or None
-        },
+        "user_details": user_details,
         "event": event,
         "event_time_gmt": get_time_gmt()
     }
@@ -115,32 +519,27 @@ def get_time_gmt():
     return strftime("%Y-%m-%d %H:%M:%S", gmtime())
 
 
-def get_resource(instance):
+def get_resource(instance, resource_type=None, resolve_username=True):
     """get instance details and return as resource dictonary"""
     # Check that instance is one of the models that's configured for logging
-    audit_model_lookup = configure_audit_models()
-    resource_type = None
-    for resource_type, model_type in audit_model_lookup.items():
-        if isinstance(instance, model_type):
-            resource_type = resource_type
-            break
+    if resource_type is None:
+        resource_type = get_resource_type(instance)
 
     # Not one of the models configured for logging
     if resource_type is None:
         return {}
 
-    # Check for existence of each of these fields in order on instance until one is found or all are tried.
-    username_fields = ['user', 'owner', ]
+    options = get_audit_options(instance)
     username = None
-    for ufield in username_fields:
-        user = getattr(instance, ufield, None)
-        if user is not None:
-            username = getattr(user, 'username', None)
+    if resolve_username:
+        # Check for existence of each of these fields in order on instance until one is found or all are tried.
+        for ufield in get_owner_fields(type(instance)):
+            username = get_owner_username(instance, ufield)
             if username is not None:
                 break
 
     id = None
-    id_fields = ['uuid', 'uid', 'id']
+    id_fields = [options['id_field']] if 'id_field' in options else DEFAULT_ID_FIELDS
     for id_field in id_fields:
         id = getattr(instance, id_field, None)
         if id is not None:
@@ -155,24 +554,169 @@ def get_resource(instance):
     return resource
 
 
+def get_owner_foreign_key(cls, field_name):
+    """ @return: The field field_name of cls if it's a foreign key to a model with a username field, otherwise None.
+    """
+    try:
+        field = cls._meta.get_field(field_name)
+        if not field.concrete or field.related_model is None:
+            return None
+        field.related_model._meta.get_field('username')
+    except (AttributeError, FieldDoesNotExist):
+        return None
+    return field
+
+
+def is_relation_loaded(instance, field):
+    """ @return: True if the object instance.<field> refers to has already been loaded, so reading it is free.
+    """
+    if hasattr(field, 'is_cached'):
+        # Django 2.0+, where get_cache_name() is the field name and hasattr() would load the object.
+        return field.is_cached(instance)
+    return hasattr(instance, field.get_cache_name())
+
+
+def get_owner_username(instance, field_name):
+    """ @return: username of the user instance.<field_name> refers to, or None.
+        For a foreign key that isn't loaded yet, the username is looked up by the key's id (once per user in a
+        request/task) instead of loading the related object.
+    """
+    field = get_owner_foreign_key(type(instance), field_name)
+    if field is None or is_relation_loaded(instance, field):
+        user = getattr(instance, field_name, None)
+        return getattr(user, 'username', None) if user is not None else None
+
+    pk = getattr(instance, field.attname)
+    if pk is None:
+        return None
+    related_model = field.related_model
+    return get_cached_actor_value(
+        ('owner', related_model._meta.label, pk),
+        lambda: related_model._default_manager.filter(pk=pk).values_list('username', flat=True).first()
+    )
+
+
+def get_owner_usernames(instances):
+    """ Bulk equivalent of get_resource()'s owner lookup for instances of one model.
+        @return: [<owner username or None>, ...] in the order of instances, with one query per owner foreign key.
+    """
+    usernames = [None] * len(instances)
+    if not instances:
+        return usernames
+    cls = type(instances[0])
+    for ufield in get_owner_fields(cls):
+        pending = [i for i, username in enumerate(usernames) if username is None]
+        field = get_owner_foreign_key(cls, ufield)
+        if field is None:
+            for i in pending:
+                usernames[i] = get_owner_username(instances[i], ufield)
+            continue
+        pks = set(getattr(instances[i], field.attname) for i in pending) - {None}
+        username_by_pk = dict(
+            field.related_model._default_manager.filter(pk__in=pks).values_list('pk', 'username')
+        ) if pks else {}
+        for i in pending:
+            usernames[i] = username_by_pk.get(getattr(instances[i], field.attname))
+    return usernames
+
+
 def get_user_crud_details(contact):
     """get user crud details and return as user_details dictionary"""
-    user_details = {
+    return dict(get_cached_actor_value(('crud', contact.pk), lambda: {
         "username": contact.username,
         "superuser": contact.is_superuser,
         "staff": contact.is_staff,
         "fullname": contact.get_full_name() or None,
         "email": contact.email or None
-    }
-    return user_details
+    }))
 
 
 def write_entry(d):
-    """write dictionary to json file output"""
-    with open(AUDIT_LOGFILE_LOCATION, 'a') as j:
-        json.dump(d, j, sort_keys=True)
-        j.write('\n')
-        j.close()
+    """write dictionary to json file output
+       With AUDIT_ON_COMMIT, entries written inside a transaction are only written once it commits and are discarded
+       if it's rolled back, like event records (see save_events()).
+    """
+    if AUDIT_ON_COMMIT and transaction.get_connection().in_atomic_block:
+        from audit_logging.writers import save_on_commit
+        save_on_commit(d, write_committed_entries)
+    else:
+        append_entry(d)
+
+
+def append_entry(d):
+    with metrics.timer('audit_sink_seconds', sink='file'):
+        audit_log_file.write(d)
+    metrics.increment('audit_sink_events_total', sink='file')
+
+
+def write_committed_entries(entries):
+    """ transaction.on_commit() callback of write_entry(), logging rather than raising like
+        dispatch_committed_events().
+    """
+    try:
+        for d in entries:
+            append_entry(d)
+    except Exception as ex:
+        logger.exception('Exception writing audit log entries on commit.')
+        metrics.count_error('on_commit_file', ex)
+
+
+def get_audit_event_dict(audit_event):
+    """ Returns a stored AuditEvent as a dictionary shaped like the entries write_entry() writes.
+    """
+    d = {
+        "event": audit_event.event,
+        "event_time_gmt": audit_event.datetime.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "user_details": {
+            "username": audit_event.username,
+            "ip": audit_event.ip,
+            "superuser": audit_event.superuser,
+            "staff": audit_event.staff,
+            "fullname": audit_event.fullname,
+            "email": audit_event.email
+        },
+        "resource": {
+            "id": audit_event.resource_uuid,
+            "type": audit_event.resource_type,
+            "title": audit_event.resource_title
+        },
+        "count": audit_event.count,
+        "size": audit_event.size,
+        "last_event_time_gmt": None
+    }
+    if audit_event.last_datetime:
+        d["last_event_time_gmt"] = audit_event.last_datetime.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return d
+
+
+def parse_utc_datetime(value):
+    """ Parses a date or ISO 8601 datetime string, treating naive values as UTC.
+        @return: Aware datetime, or None if value can't be parsed.
+    """
+    dt = parse_datetime(value)
+    if dt is None:
+        date = parse_date(value)
+        if date is None:
+            return None
+        dt = datetime(date.year, date.month, date.day)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.utc)
+    return dt
+
+
+def iterate_in_chunks(queryset, chunk_size=1000):
+    """ Yields lists of up to chunk_size objects from queryset in primary key order, fetching each list with its
+        own query (keyset pagination on pk) so memory use and query cost don't grow with the size of queryset.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
 
 
 def get_client_ip(request):
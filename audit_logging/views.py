@@ -0,0 +1,38 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+
+from audit_logging.audit_settings import AUDIT_METRICS_TOKEN
+from audit_logging.compact import stored_events
+from audit_logging.export import CONTENT_TYPES, FILTERS, export_lines, filter_audit_events
+from audit_logging.metrics import metrics
+
+
+@staff_member_required
+def export_audit_events(request):
+    """ Streams the stored events (AuditEvent or CompactAuditEvent rows, see AUDIT_STORAGE) as CSV (?format=csv,
+        default) or JSON lines (?format=jsonl), filtered by the since, until, username, event, resource_type &
+        resource_uuid query string parameters.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest('Unknown format {}'.format(export_format))
+    try:
+        queryset = filter_audit_events(stored_events(), **{name: request.GET.get(name) for name in FILTERS})
+    except ValueError as ex:
+        return HttpResponseBadRequest(str(ex))
+
+    response = StreamingHttpResponse(export_lines(queryset, export_format), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = 'attachment; filename="audit_events.{}"'.format(export_format)
+    return response
+
+
+def audit_metrics(request):
+    """ Audit pipeline metrics in the Prometheus text format, for staff users or a scraper sending
+        'Authorization: Bearer <AUDIT_METRICS_TOKEN>'.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token_ok = AUDIT_METRICS_TOKEN and constant_time_compare(authorization, 'Bearer {}'.format(AUDIT_METRICS_TOKEN))
+    if not (token_ok or request.user.is_active and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.prometheus_text(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+""" Persists event records (dicts of AuditEvent field values, see utils.build_event_record()) to the database.
+"""
+import atexit
+from collections import OrderedDict
+from datetime import timedelta
+import functools
+import heapq
+import itertools
+from logging import getLogger
+import threading
+import time
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from audit_logging.audit_settings import (
+    AUDIT_BUFFER_SIZE, AUDIT_BUFFER_INTERVAL, AUDIT_DEDUP_SIZE, AUDIT_DEDUP_WINDOW, AUDIT_STORAGE
+)
+from audit_logging.metrics import metrics
+
+
+logger = getLogger(__name__)
+
+
+def write_events(records):
+    """ Writes event records to the database in a single INSERT, as CompactAuditEvent rows if AUDIT_STORAGE is
+        'compact'.
+    """
+    if not records:
+        return
+    with metrics.timer('audit_sink_seconds', sink='db'):
+        if AUDIT_STORAGE == 'compact':
+            from audit_logging.compact import compact_event
+            from audit_logging.models import CompactAuditEvent
+            CompactAuditEvent.objects.bulk_create([compact_event(record) for record in records])
+        else:
+            # Import AuditEvent here so this module can be imported before django apps are ready
+            from audit_logging.models import AuditEvent
+            AuditEvent.objects.bulk_create([AuditEvent(**record) for record in records])
+    metrics.increment('audit_sink_events_total', len(records), sink='db')
+
+
+def save_on_commit(record, save, using=None):
+    """ Adds record to the batch for save in the current transaction, or savepoint within it, and arranges for
+        save(<batch>) to run once via transaction.on_commit().  When the transaction or savepoint is rolled back,
+        Django drops the on_commit callback and the batch goes with it.
+    """
+    connection = transaction.get_connection(using)
+    live_callbacks = [func for savepoint_ids, func in connection.run_on_commit]
+    batches = getattr(connection, 'audit_on_commit_batches', {})
+    level = (tuple(connection.savepoint_ids), save)
+    records, callback = batches.get(level, (None, None))
+    if callback is None or callback not in live_callbacks:
+        records = []
+        callback = functools.partial(save, records)
+        # Forget batches that were saved or rolled back.
+        batches = {key: batch for key, batch in batches.items() if batch[1] in live_callbacks}
+        batches[level] = (records, callback)
+        connection.audit_on_commit_batches = batches
+        transaction.on_commit(callback, using)
+    records.append(record)
+
+
+class EventBuffer(object):
+    """ Collects event records in memory and writes them with write_events() in batches.
+        The buffer is flushed when it holds max_size records or when interval seconds have passed since the
+        last flush, checked as records are added and by a timer interval seconds after the first record pending, so
+        an idle process doesn't keep them in memory; call flush() to write pending records at any other time (end of
+        request, process exit).
+        The buffer is shared by every thread, so a flush due inside a transaction waits until it commits: written
+        as part of it, other requests' events would be lost if it were rolled back.
+    """
+    def __init__(self, max_size=AUDIT_BUFFER_SIZE, interval=AUDIT_BUFFER_INTERVAL):
+        self.max_size = max_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.time()
+        self.flush_timer = None
+
+    def add(self, record):
+        with self.lock:
+            self.pending.append(record)
+            due = len(self.pending) >= self.max_size or time.time() - self.last_flush >= self.interval
+            if not due and self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.interval, self.flush_on_timer)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        if not due:
+            return
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.flush()
+        elif self.flush not in [func for savepoint_ids, func in connection.run_on_commit]:
+            # If the transaction is rolled back the records stay pending for the next flush.
+            transaction.on_commit(self.flush)
+
+    def flush_on_timer(self):
+        """ Writes the pending records from the timer's thread, which is outside any transaction.
+        """
+        try:
+            self.flush()
+        except Exception as ex:
+            logger.exception('Exception flushing buffered audit events.')
+            metrics.count_error('buffer_flush', ex)
+        finally:
+            # The timer's thread ends here, so its database connection isn't used again.
+            connections.close_all()
+
+    def flush(self):
+        with self.lock:
+            records, self.pending = self.pending, []
+            self.last_flush = time.time()
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+        if records:
+            logger.debug('Flushing {} buffered audit events'.format(len(records)))
+            write_events(records)
+
+    def __len__(self):
+        return len(self.pending)
+
+
+event_buffer = EventBuffer()
+metrics.add_collector(lambda: [('audit_buffer_pending', 'gauge', {}, len(event_buffer))])
+
+
+def flush_event_buffer():
+    """ Writes any buffered event records, logging rather than raising on failure so callers on the request path
+        (middleware, task teardown, interpreter exit) are never interrupted by auditing.
+    """
+    try:
+        event_buffer.flush()
+    except Exception as ex:
+        logger.exception('Exception flushing buffered audit events.')
+        metrics.count_error('buffer_flush', ex)
+
+
+atexit.register(flush_event_buffer)
+
+
+class EventDeduplicator(object):
+    """ Collapses the records of an event repeated by the same user on the same resource within window seconds of
+        its first occurrence into one record: the first one, with the count & size of all of them and the time of the
+        last one as last_datetime.  Records are held until their window has passed (checked as records are added and
+        by release(expired_only=True)), until max_size other events are held and this one is the least recently
+        repeated, or until release().
+    """
+    def __init__(self, window=AUDIT_DEDUP_WINDOW, max_size=AUDIT_DEDUP_SIZE):
+        self.window = timedelta(seconds=window or 0)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # {(<event>, <username>, <resource type>, <resource uuid>): <record>, ...}, least recently repeated first.
+        self.held = OrderedDict()
+        # Heap of (<end of window>, <sequence>, <key>, <record>) for each record held, including ones since released
+        #   or replaced, which are skipped when they reach the front.
+        self.expiries = []
+        self.sequence = itertools.count()
+        # When the earliest held record's window ends, None if nothing is held.
+        self.next_expiry = None
+
+    @staticmethod
+    def key(record):
+        return record.get('event'), record.get('username'), record.get('resource_type'), record.get('resource_uuid')
+
+    def add(self, records):
+        """ @return: The records released, to be written now.
+        """
+        released = []
+        with self.lock:
+            for record in records:
+                key = self.key(record)
+                held = self.held.get(key)
+                if held is not None and record['datetime'] - held['datetime'] < self.window:
+                    self.merge(held, record)
+                    self.held.move_to_end(key)
+                    continue
+                if held is not None:
+                    released.append(self.held.pop(key))
+                held = self.held[key] = dict(record)
+                expiry = record['datetime'] + self.window
+                heapq.heappush(self.expiries, (expiry, next(self.sequence), key, held))
+                if self.next_expiry is None or expiry < self.next_expiry:
+                    self.next_expiry = expiry
+                if len(self.held) > self.max_size:
+                    released.append(self.held.popitem(last=False)[1])
+            released.extend(self.pop_expired())
+        return released
+
+    @staticmethod
+    def merge(held, record):
+        held['count'] = held.get('count', 1) + record.get('count', 1)
+        if record.get('size') is not None:
+            held['size'] = (held.get('size') or 0) + record['size']
+        held['last_datetime'] = max(
+            held.get('last_datetime') or held['datetime'], record.get('last_datetime') or record['datetime']
+        )
+        metrics.increment('audit_dedup_merged_total', record.get('count', 1), event=record.get('event'))
+
+    def has_expired(self):
+        return self.next_expiry is not None and timezone.now() >= self.next_expiry
+
+    def pop_expired(self):
+        if not self.has_expired():
+            return []
+        now = timezone.now()
+        released = []
+        while self.expiries and self.expiries[0][0] <= now:
+            expiry, sequence, key, record = heapq.heappop(self.expiries)
+            if self.held.get(key) is record:
+                released.append(self.held.pop(key))
+        self.next_expiry = self.expiries[0][0] if self.expiries else None
+        return released
+
+    def release(self, expired_only=False):
+        """ @return: The held records whose window has passed, or all of them.
+        """
+        with self.lock:
+            if expired_only:
+                return self.pop_expired()
+            records = list(self.held.values())
+            self.held.clear()
+            self.expiries = []
+            self.next_expiry = None
+        return records
+
+    def __len__(self):
+        return len(self.held)
+
+
+event_deduplicator = EventDeduplicator()
+metrics.add_collector(lambda: [('audit_dedup_held', 'gauge', {}, len(event_deduplicator))])
+
+
+def flush_deduplicated_events(expired_only=False, write=None):
+    """ Saves the records event_deduplicator releases, logging rather than raising on failure like
+        flush_event_buffer().
+        @param write: Called with the records (default: utils.route_events(), as for records released by add()).
+    """
+    try:
+        records = event_deduplicator.release(expired_only)
+        if records:
+            if write is None:
+                from audit_logging.utils import route_events
+                write = route_events
+            logger.debug('Saving {} deduplicated audit events'.format(len(records)))
+            write(records)
+    except Exception as ex:
+        logger.exception('Exception saving deduplicated audit events.')
+        metrics.count_error('dedup_flush', ex)
+
+
+# Registered after flush_event_buffer so it runs first; records are written directly since the event buffer and
+#   background writer may already be shut down.
+atexit.register(flush_deduplicated_events, False, write_events)
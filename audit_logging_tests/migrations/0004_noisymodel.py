@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit_logging_tests', '0003_unauditedmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoisyModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field1', models.CharField(max_length=120)),
+                ('last_seen', models.DateTimeField(null=True)),
+                ('visits', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
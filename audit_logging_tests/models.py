@@ -1,6 +1,32 @@
 from __future__ import unicode_literals
 
+from django.conf import settings
 from django.db import models
 
+from audit_logging.managers import AuditedManager
+
 class TestModel(models.Model):
     field1 = models.CharField(max_length=120)
+
+
+class OwnedModel(models.Model):
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    field1 = models.CharField(max_length=120)
+
+    objects = AuditedManager()
+
+
+class UnauditedModel(models.Model):
+    """ Not in AUDIT_MODELS; the baseline for what auditing costs in benchmarks/hot_paths.py.
+    """
+    field1 = models.CharField(max_length=120)
+
+
+class NoisyModel(models.Model):
+    """ Audited with rules that skip updates of last_seen & visits (see AUDIT_MODELS in settings).
+    """
+    field1 = models.CharField(max_length=120)
+    last_seen = models.DateTimeField(null=True)
+    visits = models.IntegerField(default=0)
+
+    objects = AuditedManager()
@@ -0,0 +1,251 @@
+""" Measures what auditing costs on its hot paths and compares the results with stored baselines.
+
+    python -m benchmarks.hot_paths [--events 1000] [--repeat 7] [--threads 1,8,32] [--threshold 0.25]
+                                   [--update-baseline]
+
+Runs against the benchmark database (see benchmarks/settings.py) and reports:
+    *_overhead_us: microseconds per event added by auditing a model save/delete (over the same operation on
+        UnauditedModel) or by LoggingFile over plain file reads/writes.
+    *_us: microseconds per call of utils.log_event() and utils.write_entry().
+    throughput_<n>_threads: audited saves per second with n threads saving concurrently.
+The results are compared with benchmarks/baselines/<database vendor>.json and the run fails (exit status 1) if an
+overhead or time grew, or a throughput fell, by more than --threshold (a fraction of the baseline).  Baselines only
+mean something on the machine they were recorded on: record them there with --update-baseline.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+# Differences smaller than this (in microseconds) are noise rather than regressions, whatever the threshold.
+MIN_DIFFERENCE_US = 2.0
+
+
+def time_per_call(func, count, setup=None):
+    """ @return: Seconds per call of func(i) for i in range(count).
+        setup(count), if given, is called (untimed) first and its return value passed to func as well.
+    """
+    prepared = setup(count) if setup else None
+    start = time.perf_counter()
+    for i in range(count):
+        if setup:
+            func(i, prepared)
+        else:
+            func(i)
+    return (time.perf_counter() - start) / count
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def median_time_per_call(func, count, repeat, setup=None):
+    """ @return: Median over repeat runs of time_per_call().
+    """
+    return median([time_per_call(func, count, setup) for run in range(repeat)])
+
+
+def median_overhead(base, audited, count, repeat, base_setup=None, audited_setup=None):
+    """ @return: Median over repeat runs of the seconds per call audited takes over base.  Each run times both, so
+        drift during the benchmark (e.g. the database growing) affects both sides of each difference alike.
+    """
+    return median([
+        time_per_call(audited, count, audited_setup) - time_per_call(base, count, base_setup)
+        for run in range(repeat)
+    ])
+
+
+def measure_models(count, repeat):
+    from audit_logging_tests.models import TestModel, UnauditedModel
+
+    def create(model):
+        return lambda i: model.objects.create(field1='benchmark')
+
+    def delete(i, instances):
+        instances[i].delete()
+
+    def setup(model):
+        return lambda count: [model.objects.create(field1='benchmark') for i in range(count)]
+
+    return {
+        'save_unaudited_us': median_time_per_call(create(UnauditedModel), count, repeat) * 1e6,
+        'save_overhead_us': median_overhead(create(UnauditedModel), create(TestModel), count, repeat) * 1e6,
+        'delete_overhead_us': median_overhead(
+            delete, delete, count, repeat, setup(UnauditedModel), setup(TestModel)
+        ) * 1e6,
+    }
+
+
+def measure_utils(count, repeat, directory):
+    from audit_logging import utils
+    from audit_logging.log_file import AuditLogFile
+
+    results = {
+        'log_event_us': median_time_per_call(
+            lambda i: utils.log_event(event='benchmark', resource_type='file', resource_uuid=i), count, repeat
+        ) * 1e6
+    }
+
+    entry = {
+        'resource': {'id': 1, 'type': 'TestModel', 'username': 'benchmark'},
+        'event': 'update',
+        'event_time_gmt': utils.get_time_gmt(),
+    }
+    audit_log_file = utils.audit_log_file
+    utils.audit_log_file = AuditLogFile(os.path.join(directory, 'audit_log.json'))
+    try:
+        results['write_entry_us'] = median_time_per_call(lambda i: utils.write_entry(entry), count, repeat) * 1e6
+    finally:
+        utils.audit_log_file.close()
+        utils.audit_log_file = audit_log_file
+    return results
+
+
+def measure_logging_file(count, repeat, directory):
+    from audit_logging.file_logging import LoggingFile
+
+    location = os.path.join(directory, 'data')
+    data = 'x' * 100
+    with open(location, 'w') as f:
+        f.write(data * count)
+
+    with open(location, 'r+') as f:
+        wrapped = LoggingFile(f, {'username': 'benchmark'}, aggregate=False)
+
+        def rewind(count):
+            f.seek(0)
+
+        def overhead(call):
+            return median_overhead(
+                lambda i, _: call(f), lambda i, _: call(wrapped), count, repeat, rewind, rewind
+            ) * 1e6
+
+        return {
+            'logging_file_write_overhead_us': overhead(lambda file: file.write(data)),
+            'logging_file_read_overhead_us': overhead(lambda file: file.read(len(data))),
+        }
+
+
+def measure_throughput(thread_count, count):
+    """ @return: Audited saves per second with thread_count threads each saving count instances.
+    """
+    from django.db import connection
+    from audit_logging_tests.models import TestModel
+
+    def work():
+        try:
+            for i in range(count):
+                TestModel.objects.create(field1='benchmark')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=work) for i in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return thread_count * count / (time.perf_counter() - start)
+
+
+def compare(results, baseline, threshold):
+    """ @return: Descriptions of the results that regressed from baseline by more than threshold.
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if name.startswith('throughput_'):
+            regressed = value < expected * (1 - threshold)
+        else:
+            regressed = value - expected > max(abs(expected) * threshold, MIN_DIFFERENCE_US)
+        if regressed:
+            regressions.append('{}: {:.1f} (baseline {:.1f})'.format(name, value, expected))
+    return regressions
+
+
+def clean_up(audit_event_max_id):
+    """ Removes the rows the benchmarks added, without auditing the deletes.
+    """
+    from django.db import connection
+    from audit_logging.models import AuditEvent
+    from audit_logging_tests.models import TestModel, UnauditedModel
+
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in (TestModel, UnauditedModel):
+            cursor.execute('DELETE FROM {}'.format(qn(model._meta.db_table)))
+        cursor.execute(
+            'DELETE FROM {} WHERE id > %s'.format(qn(AuditEvent._meta.db_table)), [audit_event_max_id or 0]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1000, help='Events per measurement.')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--threads', default='1,8,32', help='Comma separated thread counts for throughput.')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--baseline', help='Baseline file (default benchmarks/baselines/<database vendor>.json).')
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.models import Max
+    from audit_logging.models import AuditEvent
+
+    call_command('migrate', verbosity=0)
+    baseline_location = args.baseline or os.path.join(BASELINE_DIRECTORY, '{}.json'.format(connection.vendor))
+    audit_event_max_id = AuditEvent.objects.aggregate(max_id=Max('id'))['max_id']
+    directory = tempfile.mkdtemp()
+    try:
+        results = {}
+        results.update(measure_models(args.events, args.repeat))
+        results.update(measure_utils(args.events, args.repeat, directory))
+        results.update(measure_logging_file(args.events, args.repeat, directory))
+        for thread_count in [int(n) for n in args.threads.split(',')]:
+            results['throughput_{}_threads'.format(thread_count)] = measure_throughput(
+                thread_count, max(args.events // thread_count, 1)
+            )
+    finally:
+        shutil.rmtree(directory)
+        clean_up(audit_event_max_id)
+
+    for name, value in sorted(results.items()):
+        print('{}: {:.1f}'.format(name, value))
+
+    if args.update_baseline:
+        with open(baseline_location, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write('\n')
+        print('Stored baseline {}'.format(baseline_location))
+        return
+
+    if not os.path.exists(baseline_location):
+        print('No baseline at {}; record one with --update-baseline.'.format(baseline_location))
+        return
+    with open(baseline_location) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print('Regressed by more than {:.0%}:'.format(args.threshold))
+        for regression in regressions:
+            print('    {}'.format(regression))
+        sys.exit(1)
+    print('No regressions against {}'.format(baseline_location))
+
+
+if __name__ == '__main__':
+    main()
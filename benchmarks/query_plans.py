@@ -0,0 +1,148 @@
+""" Shows query plans and timings for the AuditEvent lookups the indexes added in migration 0004 are for.
+
+    python -m benchmarks.query_plans --rows 10000000 [--compare]
+
+Populates the benchmark database (see benchmarks/settings.py) with synthetic AuditEvent rows up to --rows, then for
+each query prints its plan and the median time over --repeat runs.  With --compare the queries are run again after
+dropping the indexes from 0004, which are created again afterwards.
+"""
+import argparse
+from datetime import timedelta
+import os
+import random
+import time
+
+
+QUERIES = [
+    ('history of a resource', lambda AuditEvent, now: AuditEvent.objects.filter(
+        resource_type='resource7', resource_uuid='uuid-1234'
+    ).order_by('-datetime')[:50]),
+    ('user activity last week', lambda AuditEvent, now: AuditEvent.objects.filter(
+        username='user42', datetime__gte=now - timedelta(days=7)
+    ).order_by('-datetime')[:100]),
+    ('latest events (admin changelist)', lambda AuditEvent, now: AuditEvent.objects.order_by('-datetime')[:100]),
+]
+
+
+def populate(AuditEvent, rows, batch_size):
+    from django.utils import timezone
+
+    existing = AuditEvent.objects.count()
+    if existing >= rows:
+        return
+    print('Adding {} AuditEvent rows...'.format(rows - existing))
+    random.seed(existing)
+    now = timezone.now()
+    events = ['create', 'update', 'delete', 'FileRead', 'FileWrite', 'login']
+    remaining = rows - existing
+    while remaining > 0:
+        count = min(batch_size, remaining)
+        AuditEvent.objects.bulk_create([
+            AuditEvent(
+                event=random.choice(events),
+                username='user{}'.format(random.randrange(10000)),
+                datetime=now - timedelta(seconds=random.randrange(365 * 24 * 3600)),
+                resource_type='resource{}'.format(random.randrange(80)),
+                resource_uuid='uuid-{}'.format(random.randrange(1000000)),
+            )
+            for i in range(count)
+        ])
+        remaining -= count
+
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN ANALYZE '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return '\n'.join('    {}'.format(' '.join(str(col) for col in row)) for row in cursor.fetchall())
+
+
+# Columns of the indexes added in migration 0004.
+INDEXED_COLUMNS = [['datetime'], ['username', 'datetime'], ['resource_type', 'resource_uuid', 'datetime']]
+
+
+def drop_indexes(AuditEvent):
+    """ Drops the indexes added in migration 0004 directly, rather than by migrating back to 0003, which would also
+        undo the later changes to AuditEvent.
+        @return: [(<index name>, <columns>), ...] to pass to create_indexes().
+    """
+    from django.db import connection
+
+    table = AuditEvent._meta.db_table
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    dropped = [
+        (name, constraint['columns']) for name, constraint in sorted(constraints.items())
+        if constraint['index'] and not constraint['unique'] and not constraint['primary_key']
+        and constraint['columns'] in INDEXED_COLUMNS
+    ]
+    with connection.schema_editor() as editor:
+        for name, columns in dropped:
+            editor.execute(editor.sql_delete_index % {
+                'table': editor.quote_name(table), 'name': editor.quote_name(name)
+            })
+    return dropped
+
+
+def create_indexes(AuditEvent, indexes):
+    from django.db import connection
+
+    table = AuditEvent._meta.db_table
+    with connection.schema_editor() as editor:
+        for name, columns in indexes:
+            editor.execute(editor.sql_create_index % {
+                'table': editor.quote_name(table), 'name': editor.quote_name(name),
+                'columns': ', '.join(editor.quote_name(column) for column in columns), 'extra': ''
+            })
+
+
+def run_queries(AuditEvent, repeat):
+    from django.utils import timezone
+
+    now = timezone.now()
+    for name, build in QUERIES:
+        queryset = build(AuditEvent, now)
+        timings = []
+        for i in range(repeat):
+            start = time.time()
+            list(build(AuditEvent, now))
+            timings.append(time.time() - start)
+        timings.sort()
+        print('{}: median {:.2f} ms'.format(name, timings[len(timings) // 2] * 1000))
+        print(explain(queryset))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', action='store_true', help='Also time the queries without the indexes.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from audit_logging.models import AuditEvent
+
+    call_command('migrate', verbosity=0)
+    populate(AuditEvent, args.rows, args.batch_size)
+
+    print('== With indexes ({} rows)'.format(args.rows))
+    run_queries(AuditEvent, args.repeat)
+
+    if args.compare:
+        indexes = drop_indexes(AuditEvent)
+        try:
+            print('== Without indexes ({} rows, {} dropped)'.format(args.rows, len(indexes)))
+            run_queries(AuditEvent, args.repeat)
+        finally:
+            create_indexes(AuditEvent, indexes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+""" Settings for the benchmarks: the development project's settings with the database taken from the environment.
+    AUDIT_BENCHMARK_DATABASE=sqlite (default) uses AUDIT_BENCHMARK_SQLITE_NAME (default /tmp/audit_benchmark.sqlite3);
+    AUDIT_BENCHMARK_DATABASE=postgresql uses the usual PGDATABASE/PGUSER/PGPASSWORD/PGHOST/PGPORT variables.
+"""
+import os
+
+from django_audit_logging.settings import *  # noqa
+
+if os.environ.get('AUDIT_BENCHMARK_DATABASE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PGDATABASE', 'audit_benchmark'),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('AUDIT_BENCHMARK_SQLITE_NAME', '/tmp/audit_benchmark.sqlite3'),
+            # Threads in hot_paths.py wait for each other's writes rather than failing with 'database is locked'.
+            'OPTIONS': {'timeout': 60},
+        }
+    }
@@ -18,7 +18,7 @@
 #
 #########################################################################
 
-from distutils.core import setup
+from setuptools import setup
 import os
 
 
@@ -33,15 +33,26 @@ setup(
     description="Logs events for auditing purposes.",
     long_description=README,
     classifiers=[
-        "Development Status :: 4 - Beta"],
+        "Development Status :: 4 - Beta",
+        "Framework :: Django",
+        "Programming Language :: Python :: 3"],
     keywords='',
     author='Dan Berry / Jivan Amara',
     author_email='Development@JivanAmara.net',
     license='GPL',
-    packages=['audit_logging', 'audit_logging.migrations'],
+    packages=[
+        'audit_logging', 'audit_logging.migrations', 'audit_logging.management', 'audit_logging.management.commands',
+        'audit_logging.templatetags'
+    ],
     include_package_data=True,
-    package_data={'audit_logging': ['version']},
+    package_data={'audit_logging': ['version', 'templates/admin/audit_logging/auditevent/*.html']},
+    # contextvars & async def (utils.py); NullBooleanField & django.conf.urls.url are gone from Django 4.0.
+    python_requires=">=3.7",
     install_requires=[
-        "Django >=1.8.7, <= 1.10",
+        "Django >=1.11, <4.0",
     ],
+    extras_require={
+        # Native async middleware (UserDetailsMiddleware under ASGI) & sync_to_async for alog_event().
+        "asgi": ["Django >=3.1, <4.0", "asgiref >=3.2.10"],
+    },
 )